@@ -0,0 +1,227 @@
+# bench/fakes.py
+"""Фейковые внешние сервисы для локального бенчмарка.
+
+YandexGPT подменяется транспортом httpx, Bot API — сессией aiogram,
+Telethon — клиентом с синтетическими постами. Каждый фейк выдерживает
+заданную задержку и считает обращения в общий BenchStats.
+"""
+import asyncio
+import itertools
+import json
+import random
+import re
+import time
+import zlib
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+
+import httpx
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import EditMessageText, SendMessage
+from aiogram.types import Chat, Message
+from telethon.tl.types import InputPeerChannel
+
+
+@dataclass
+class BenchStats:
+    requests: Counter = field(default_factory=Counter)
+    latencies: dict[str, list[float]] = field(default_factory=dict)
+
+    def count(self, name: str):
+        self.requests[name] += 1
+
+    def observe(self, name: str, seconds: float):
+        self.latencies.setdefault(name, []).append(seconds)
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+@dataclass
+class Latency:
+    """Задержка ответа: mean ± jitter секунд."""
+    mean: float = 0.0
+    jitter: float = 0.0
+
+    def sample(self) -> float:
+        return max(0.0, self.mean + random.uniform(-self.jitter, self.jitter))
+
+
+# --- YandexGPT ---
+_MARKER_RE = re.compile(r"^\s*\[\[(\d+)\]\]", re.MULTILINE)
+
+
+def _fake_summary(text: str) -> str:
+    markers = _MARKER_RE.findall(text)
+    if markers:
+        # пакетный запрос: отвечаем блоком на каждый маркер
+        return "\n".join(f"[[{n}]] Кратко о посте {n}.\nновости, события" for n in markers)
+    return f"Кратко: {' '.join(text.split()[:12])}"
+
+
+class FakeYandexGPT:
+    """completion, completionAsync и operations поверх httpx.MockTransport.
+
+    Синхронный ответ приходит через request_latency + operation_latency;
+    асинхронная операция становится done через operation_latency после
+    создания, а каждый GET операции стоит request_latency.
+    """
+
+    def __init__(self, stats: BenchStats, request_latency: Latency, operation_latency: Latency):
+        self.stats = stats
+        self.request_latency = request_latency
+        self.operation_latency = operation_latency
+        self._operations: dict[str, tuple[float, str]] = {}
+        self._ids = itertools.count(1)
+
+    def transport(self) -> httpx.MockTransport:
+        return httpx.MockTransport(self.handle)
+
+    @staticmethod
+    def _result(text: str) -> dict:
+        return {"alternatives": [{"message": {"role": "assistant", "text": text}, "status": "ALTERNATIVE_STATUS_FINAL"}]}
+
+    async def _stream(self, summary: str):
+        # чанки с накопленным текстом, равномерно за время генерации
+        words = summary.split()
+        pause = self.operation_latency.sample() / max(1, len(words))
+        for i in range(1, len(words) + 1):
+            await asyncio.sleep(pause)
+            yield (json.dumps({"result": self._result(" ".join(words[:i]))}, ensure_ascii=False) + "\n").encode()
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(self.request_latency.sample())
+        path = request.url.path
+        if request.method == "POST" and path.endswith("/completion"):
+            self.stats.count("gpt.completion")
+            body = json.loads(request.content)
+            summary = _fake_summary(body["messages"][-1]["text"])
+            if body.get("completionOptions", {}).get("stream"):
+                return httpx.Response(200, content=self._stream(summary))
+            await asyncio.sleep(self.operation_latency.sample())
+            return httpx.Response(200, json={"result": self._result(summary)})
+        if request.method == "POST" and path.endswith("/completionAsync"):
+            self.stats.count("gpt.completionAsync")
+            text = json.loads(request.content)["messages"][-1]["text"]
+            op_id = f"op{next(self._ids)}"
+            self._operations[op_id] = (time.monotonic() + self.operation_latency.sample(), _fake_summary(text))
+            return httpx.Response(200, json={"id": op_id, "done": False})
+        if request.method == "GET" and "/operations/" in path:
+            self.stats.count("gpt.operation")
+            ready_at, text = self._operations[path.rsplit("/", 1)[-1]]
+            if time.monotonic() < ready_at:
+                return httpx.Response(200, json={"id": path, "done": False})
+            return httpx.Response(200, json={"id": path, "done": True, "response": self._result(text)})
+        return httpx.Response(404)
+
+
+# --- Bot API ---
+class FakeBotSession(BaseSession):
+    """Сессия aiogram без сети: sendMessage и editMessageText возвращают Message."""
+
+    def __init__(self, stats: BenchStats, latency: Latency):
+        super().__init__()
+        self.stats = stats
+        self.latency = latency
+        self._ids = itertools.count(1)
+
+    async def make_request(self, bot, method, timeout=None):
+        await asyncio.sleep(self.latency.sample())
+        self.stats.count(f"bot.{type(method).__name__}")
+        if isinstance(method, (SendMessage, EditMessageText)):
+            return Message(
+                message_id=getattr(method, "message_id", None) or next(self._ids),
+                date=datetime.now(timezone.utc),
+                chat=Chat(id=int(method.chat_id or 0), type="private"),
+                text=method.text,
+            )
+        return True
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b""
+
+    async def close(self):
+        pass
+
+
+# --- Telethon ---
+@dataclass
+class FakeMessage:
+    id: int
+    date: datetime
+    message: str
+    views: int = 0
+    forwards: int = 0
+    reactions: object = None
+
+
+_TOPICS = [
+    "ЦБ сохранил ключевую ставку на прежнем уровне, рынок ожидал снижения",
+    "Новый смартфон получил складной экран и батарею большей ёмкости",
+    "В столице открылась выставка современного искусства с бесплатным входом",
+    "Команда выиграла финал кубка в серии пенальти после ничьей",
+    "Разработчики выпустили крупное обновление языка программирования",
+    "Учёные нашли способ ускорить зарядку литиевых аккумуляторов",
+]
+
+
+class FakeTelethonClient:
+    """TelegramClient с синтетической лентой: у каждого канала posts_per_channel
+    постов, часть из них — перепечатки общих новостей (для кластеризации)."""
+
+    def __init__(self, stats: BenchStats, latency: Latency, posts_per_channel: int = 30, repost_ratio: float = 0.3):
+        self.stats = stats
+        self.latency = latency
+        self.posts_per_channel = posts_per_channel
+        self.repost_ratio = repost_ratio
+        self.flood_sleep_threshold = 60
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def is_connected(self) -> bool:
+        return True
+
+    async def get_input_entity(self, url: str) -> InputPeerChannel:
+        await asyncio.sleep(self.latency.sample())
+        self.stats.count("telethon.resolve")
+        channel_id = zlib.crc32(url.encode())
+        return InputPeerChannel(channel_id=channel_id, access_hash=channel_id * 7919)
+
+    def _feed(self, channel_id: int) -> list[FakeMessage]:
+        rnd = random.Random(channel_id)
+        start = datetime.now(timezone.utc) - timedelta(hours=self.posts_per_channel)
+        feed = []
+        for i in range(1, self.posts_per_channel + 1):
+            if rnd.random() < self.repost_ratio:
+                text = f"{rnd.choice(_TOPICS)}. Подробнее по ссылке https://t.me/c{channel_id}/{i}"
+            else:
+                text = f"Пост {i} канала {channel_id}: " + " ".join(
+                    rnd.choice(("новости", "рынок", "город", "спорт", "технологии", "погода", "наука", "курс"))
+                    for _ in range(40)
+                )
+            views = rnd.randint(100, 10000)
+            feed.append(FakeMessage(
+                id=i,
+                date=start + timedelta(hours=i),
+                message=text,
+                views=views,
+                forwards=rnd.randint(0, views // 50),
+            ))
+        return feed
+
+    async def get_messages(self, peer, limit: int = 20, min_id: int = 0, reverse: bool = False, **kwargs):
+        await asyncio.sleep(self.latency.sample())
+        self.stats.count("telethon.get_messages")
+        feed = [m for m in self._feed(peer.channel_id) if m.id > min_id]
+        if reverse:
+            return feed[:limit]
+        return list(reversed(feed))[:limit]
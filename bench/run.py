@@ -0,0 +1,241 @@
+# bench/run.py
+"""Локальный сквозной бенчмарк: webhook и дайджест на фейковых сервисах.
+
+Запуск из корня репозитория (нужен aiosqlite):
+
+    python -m bench.run --users 200 --gpt-latency 0.3 --bot-latency 0.05
+
+YDB заменяется файлом SQLite через DB_URL, YandexGPT, Bot API и Telethon —
+фейками из bench.fakes. В конце печатается JSON-отчёт: перцентили задержки
+вызовов webhook, пропускная способность, время прогонов дайджеста и число
+обращений к каждому внешнему сервису и к базе.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from bench.fakes import (
+    BenchStats,
+    FakeBotSession,
+    FakeTelethonClient,
+    FakeYandexGPT,
+    Latency,
+    percentile,
+)
+
+_BENCH_ENV = {
+    "API_TOKEN": "123456789:BENCHMARK-TOKEN",
+    "YDB_ENDPOINT": "bench",
+    "YDB_DATABASE": "bench",
+    "YANDEX_CATALOG_ID": "bench",
+    "YANDEX_KEY_ID": "bench",
+    "YANDEX_API_KEY": "bench",
+    "SUMMARIZE_MODE": "sync",
+}
+
+
+def configure_env(db_path: str, args):
+    # настройки читаются лениво, поэтому окружение выставляем до первого обращения
+    for key, value in _BENCH_ENV.items():
+        os.environ.setdefault(key, value)
+    os.environ["DB_URL"] = f"sqlite+aiosqlite:///{db_path}"
+    os.environ.setdefault("YANDEX_GPT_RPS", str(args.gpt_rps))
+    os.environ.setdefault("YANDEX_GPT_BURST", str(args.gpt_rps))
+    os.environ.setdefault("DELIVERY_GLOBAL_RPS", "1000")
+    os.environ.setdefault("DELIVERY_CHAT_RPS", "1000")
+
+
+def prepare_sqlite():
+    from sqlalchemy.ext.compiler import compiles
+    from ydb_sqlalchemy.sqlalchemy.types import UInt64
+
+    @compiles(UInt64, "sqlite")
+    def _uint64_sqlite(type_, compiler, **kw):
+        return "INTEGER"
+
+    # SQLite хранит только знаковые 64-битные целые, а отпечатки SimHash
+    # занимают все 64 бита. Для бенчмарка достаточно записать их со сдвигом:
+    # прочитанные обратно значения участвуют лишь в подавлении повторов.
+    sqlite3.register_adapter(int, lambda v: v - (1 << 64) if v >= 1 << 63 else v)
+
+
+async def init_db(stats: BenchStats):
+    from sqlalchemy import event
+    from services import db
+
+    await db.init_session()
+    engine = db.SessionLocal.kw["bind"]
+    async with engine.begin() as conn:
+        await conn.run_sync(db.Base.metadata.create_all)
+
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        stats.count(f"sql.{statement.split(None, 1)[0].upper()}")
+
+    event.listen(engine.sync_engine, "before_cursor_execute", count_statement)
+
+
+# --- Синтетические апдейты ---
+def make_update(update_id: int, user_id: int, text: str) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"},
+            "text": text,
+        },
+    }
+
+
+_WORDS = "рынок ставка город выставка команда финал обновление язык учёные аккумулятор".split()
+
+
+def user_script(user_id: int, args) -> list[str]:
+    rnd = random.Random(user_id)
+    commands = ["/start"]
+    for ch in rnd.sample(range(args.channels), min(args.channels_per_user, args.channels)):
+        keywords = ", ".join(rnd.sample(_WORDS, 3))
+        commands.append(f"/add_channel @bench_channel_{ch} | {keywords}")
+    for i in range(args.summaries_per_user):
+        words = 900 if rnd.random() < args.long_ratio else 60
+        body = " ".join(rnd.choice(_WORDS) for _ in range(words))
+        commands.append(f"/summarize user {user_id} text {i}: {body}")
+    commands.append("/top_posts")
+    return commands
+
+
+def make_batches(args) -> list[list[dict]]:
+    """Команды всех пользователей, перемешанные по вызовам webhook.
+
+    Внутри пользователя порядок сохраняется, вызовы содержат по batch_size апдейтов.
+    """
+    scripts = {uid: user_script(uid, args) for uid in range(1, args.users + 1)}
+    stream, update_id = [], 0
+    while scripts:
+        for uid in list(scripts):
+            update_id += 1
+            stream.append(make_update(update_id, uid, scripts[uid].pop(0)))
+            if not scripts[uid]:
+                del scripts[uid]
+    return [stream[i:i + args.batch_size] for i in range(0, len(stream), args.batch_size)]
+
+
+# --- Сценарии ---
+async def bench_webhook(stats: BenchStats, args) -> dict:
+    import tb_webhook
+
+    batches = make_batches(args)
+    semaphore = asyncio.Semaphore(args.invocations)
+
+    async def invoke(batch: list[dict]):
+        async with semaphore:
+            started = time.perf_counter()
+            await tb_webhook.webhook({"httpMethod": "POST", "body": json.dumps(batch)}, None)
+            stats.observe("webhook", time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(invoke(b) for b in batches))
+    elapsed = time.perf_counter() - started
+    latencies = stats.latencies.get("webhook", [])
+    updates = sum(len(b) for b in batches)
+    return {
+        "invocations": len(batches),
+        "updates": updates,
+        "seconds": round(elapsed, 3),
+        "updates_per_sec": round(updates / elapsed, 1) if elapsed else 0.0,
+        **{f"p{int(q * 100)}_ms": round(percentile(latencies, q) * 1000, 1) for q in (0.5, 0.95, 0.99)},
+    }
+
+
+async def bench_digest(stats: BenchStats, bot, args) -> list[dict]:
+    from digest_runner import digest
+
+    runs = []
+    for _ in range(args.digest_runs):
+        client = FakeTelethonClient(
+            stats,
+            Latency(args.telethon_latency, args.telethon_latency / 2),
+            posts_per_channel=args.posts_per_channel,
+        )
+        started = time.perf_counter()
+        result = await digest(bot, client)
+        elapsed = time.perf_counter() - started
+        stats.observe("digest", elapsed)
+        runs.append({"seconds": round(elapsed, 3), **result})
+    return runs
+
+
+async def main(args):
+    from aiogram import Bot
+    from core.settings.settings import settings
+    from services import llm_client
+    from services.db import summary_log
+
+    stats = BenchStats()
+    await init_db(stats)
+
+    gpt = FakeYandexGPT(
+        stats,
+        request_latency=Latency(args.http_latency, args.http_latency / 2),
+        operation_latency=Latency(args.gpt_latency, args.gpt_latency / 2),
+    )
+    cfg = settings.yandex_gpt
+    llm_client._llm_client = llm_client.YandexGPTClient(
+        api_key=cfg.api_key,
+        catalog_id=cfg.catalog_id,
+        rps=cfg.rps,
+        burst=cfg.burst,
+        max_connections=cfg.max_connections,
+        transport=gpt.transport(),
+    )
+
+    import tb_webhook
+
+    bot = Bot(
+        token=settings.bots.bot_token,
+        session=FakeBotSession(stats, Latency(args.bot_latency, args.bot_latency / 2)),
+    )
+    tb_webhook.bot = bot
+
+    # /top_posts читает кандидатов, которые собирает дайджест, поэтому
+    # в первом прогоне webhook каналы ещё без постов
+    report = {"webhook": await bench_webhook(stats, args)}
+    report["digest"] = await bench_digest(stats, bot, args)
+    await summary_log.close()
+    await llm_client._llm_client.aclose()
+    report["requests"] = dict(sorted(stats.requests.items()))
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--users", type=int, default=100)
+    p.add_argument("--channels", type=int, default=40, help="размер общего пула каналов")
+    p.add_argument("--channels-per-user", type=int, default=3)
+    p.add_argument("--summaries-per-user", type=int, default=2)
+    p.add_argument("--long-ratio", type=float, default=0.2, help="доля длинных текстов (асинхронная операция)")
+    p.add_argument("--batch-size", type=int, default=10, help="апдейтов в одном вызове webhook")
+    p.add_argument("--invocations", type=int, default=4, help="одновременных вызовов webhook")
+    p.add_argument("--posts-per-channel", type=int, default=30)
+    p.add_argument("--digest-runs", type=int, default=2)
+    p.add_argument("--gpt-latency", type=float, default=0.3, help="время генерации, с")
+    p.add_argument("--gpt-rps", type=float, default=50.0)
+    p.add_argument("--http-latency", type=float, default=0.02, help="задержка одного HTTP-запроса к YandexGPT, с")
+    p.add_argument("--bot-latency", type=float, default=0.05)
+    p.add_argument("--telethon-latency", type=float, default=0.1)
+    p.add_argument("--db", default="", help="файл SQLite (по умолчанию временный)")
+    return p.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix="resumebot-bench-"), "bench.sqlite3")
+    configure_env(db_path, args)
+    prepare_sqlite()
+    asyncio.run(main(args))
@@ -1,22 +1,23 @@
 # core/handlers/handlers.py
 from aiogram import Router, F
 from aiogram.types import Message
+from sqlalchemy.ext.asyncio import AsyncSession
 from services.db import (
     add_channel_for_user,
-    list_channels,
+    list_channels_for_user,
     save_summary,
     ensure_user
 )
-from services.summarize import summarize_text_async
-from services.telethon_task import get_top_posts, DummyClient
+from services.top_posts import get_top_posts
+from core.settings.settings import settings
+from core.utils.utils import logger
 
 router = Router()
-client = DummyClient()  # пока заглушка, для serverless Telethon-запуск можно позже
 
 # --- /start ---
 @router.message(F.text == "/start")
-async def start_cmd(message: Message):
-    await ensure_user(message.from_user.id, message.from_user.username)
+async def start_cmd(message: Message, session: AsyncSession):
+    await ensure_user(message.from_user.id, message.from_user.username, session=session)
     await message.answer(
         "Привет! Используй:\n"
         "/add_channel <ссылка или @username> | ключевое слово1, ключевое слово2 — добавить канал\n"
@@ -26,7 +27,7 @@ async def start_cmd(message: Message):
 
 # --- /add_channel ---
 @router.message(F.text.startswith("/add_channel"))
-async def add_channel(message: Message):
+async def add_channel(message: Message, session: AsyncSession):
     try:
         parts = message.text.split(" ", 1)
         if len(parts) != 2 or "|" not in parts[1]:
@@ -43,8 +44,11 @@ async def add_channel(message: Message):
             await message.answer("❌ Не указаны ключевые слова.")
             return
 
-        await ensure_user(message.from_user.id, message.from_user.username)
-        await add_channel_for_user(message.from_user.id, channel_url, keywords)
+        await ensure_user(message.from_user.id, message.from_user.username, session=session)
+        await add_channel_for_user(message.from_user.id, channel_url, keywords, session=session)
+        # подтверждаем только записанное: коммит до ответа, а не после хендлера,
+        # и транзакция не ждёт сетевого вызова Telegram
+        await session.commit()
 
         await message.answer(f"✅ Канал {channel_url} добавлен с ключевыми словами: {keywords}")
 
@@ -56,24 +60,27 @@ async def add_channel(message: Message):
 @router.message(F.text == "/top_posts")
 async def top_posts(message: Message):
     try:
-        channels = await list_channels()
-        user_channels = [ch for ch in channels if ch["user_id"] == message.from_user.id]
+        # без сессии апдейта: короткая своя сессия закрывается до сетевых запросов,
+        # а не держит транзакцию и соединение пула, пока ждём Telegram
+        user_channels = await list_channels_for_user(message.from_user.id)
 
         if not user_channels:
             await message.answer("❌ У тебя нет добавленных каналов. Используй /add_channel.")
             return
 
+        # кандидатов каналов собирает дайджест; вебхук в Telegram не ходит
+        results = await get_top_posts(user_channels)
         result_text = "📌 *Топ постов:*\n\n"
-        await client.start()
-        for ch in channels:
-            posts = await get_top_posts(ch["url"], ch["keywords"])
+        for ch, posts in zip(user_channels, results):
             result_text += f"🔹 *{ch['url']}*\n"
+            if posts is None:
+                result_text += "- ⏳ посты появятся после ближайшего дайджеста\n\n"
+                continue
             for p in posts:
                 result_text += f"- [{p['text']}]({p['link']})\n"
             result_text += "\n"
 
         await message.answer(result_text, parse_mode="Markdown")
-        await client.disconnect()
 
     except Exception as e:
         await message.answer(f"❌ Ошибка получения постов: {e}")
@@ -81,15 +88,54 @@ async def top_posts(message: Message):
 
 # --- /summarize ---
 @router.message(F.text.startswith("/summarize"))
-async def summarize(message: Message):
+async def summarize(message: Message, session: AsyncSession):
     text = message.text.replace("/summarize", "").strip()
     if not text:
         await message.answer("❌ Отправь текст после команды /summarize")
         return
 
-    await message.answer("🔹 Обрабатываю текст...")
+    placeholder = await message.answer("🔹 Обрабатываю текст...")
+
+    if settings.jobs.summarize_mode == "stream":
+        # резюме появляется в заглушке по мере генерации
+        from services.delivery import ProgressiveMessage
+        from services.summarize import summarize_text_stream
+
+        progress = ProgressiveMessage(
+            message.bot, message.chat.id, placeholder.message_id,
+            interval=settings.jobs.stream_edit_interval,
+        )
+        summary = ""
+        try:
+            async for summary in summarize_text_stream(text):
+                await progress.update(summary)
+            await progress.finish(summary)
+            await save_summary(message.from_user.id, text, summary)
+        except Exception as e:
+            await message.answer(f"❌ Ошибка при суммаризации: {e}")
+        return
+
+    if settings.jobs.summarize_mode == "async":
+        # быстрый ответ Telegram: резюме сделает summarize_worker и отредактирует заглушку
+        from services.jobs import SummarizeJob, get_job_queue
+
+        try:
+            await get_job_queue().put(SummarizeJob(
+                chat_id=message.chat.id,
+                user_id=message.from_user.id,
+                text=text,
+                placeholder_message_id=placeholder.message_id,
+            ))
+            return
+        except Exception as e:
+            logger.exception("Failed to enqueue summarize job, falling back to inline: %s", e)
+
     try:
-        summary = await summarize_text_async(text)
+        # httpx и клиент YandexGPT нужны только здесь — не грузим их на холодном старте
+        from services.summarize import summarize_text_async
+        from services.completion import INTERACTIVE
+
+        summary = await summarize_text_async(text, strategy=INTERACTIVE)
         await save_summary(message.from_user.id, text, summary)
         await message.answer(summary)
     except Exception as e:
@@ -0,0 +1,29 @@
+# core/middlewares/db.py
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from services.db import async_get_session
+
+
+class DbSessionMiddleware(BaseMiddleware):
+    """Одна сессия YDB на апдейт (unit of work).
+
+    Сессия передаётся в хендлер аргументом session; вся работа с базой
+    за апдейт идёт в одной транзакции и коммитится один раз после хендлера.
+    Соединение берётся из пула только при первом запросе к базе и держится
+    до конца хендлера, поэтому хендлер с долгими сетевыми вызовами не
+    принимает session, а обращается к базе короткими сессиями хелперов.
+    Хендлер, который подтверждает запись пользователю, коммитит сам до ответа.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        async with async_get_session() as session:
+            data["session"] = session
+            return await handler(event, data)
@@ -1,32 +1,95 @@
 # core/settings.py
 import os
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from environs import Env
 
-import ydb.iam
-
 @dataclass
 class Bots:
     bot_token: str
+    update_concurrency: int = 8
 
 @dataclass
 class YDBSettings:
     endpoint: str
     database: str
     connection_url: str
-    connection_args: dict
+    _connection_args: dict | None = field(default=None, repr=False)
+
+    @property
+    def connection_args(self) -> dict:
+        # ydb и метаданные IAM нужны только при первом подключении к базе,
+        # поэтому импорт и создание credentials откладываем до этого момента
+        if self._connection_args is None and not self.connection_url.startswith("yql"):
+            self._connection_args = {}
+        if self._connection_args is None:
+            import ydb.iam
+
+            credentials = ydb.iam.MetadataUrlCredentials()
+            self._connection_args = {
+                "_add_declare_for_yql_stmt_vars": True,
+                "connect_args": {
+                    "protocol": "grpcs",
+                    "credentials": credentials,
+                },
+            }
+        return self._connection_args
 
 @dataclass
 class YandexGPTSettings:
     catalog_id: str
     key_id: str
     api_key: str
+    rps: float = 10.0
+    burst: float = 10.0
+    max_connections: int = 20
+
+@dataclass
+class DigestSettings:
+    fetch_concurrency: int
+    summarize_concurrency: int
+    deliver_concurrency: int
+    queue_size: int
+    fetch_limit: int
+    initial_fetch_limit: int
+    dedup_days: int
+    delivery_global_rps: float
+    delivery_chat_rps: float
+    outbox_max_attempts: int
+    shards: int = 1  # на сколько независимых вызовов делится прогон
+    run_period: int = 86400  # секунд: прогоны внутри периода делят чекпоинты
+    # работа одного вызова: остальное достанется следующему вызову шарда
+    max_channels: int = 2000  # уникальных каналов, 0 — без ограничения
+    time_reserve: int = 120  # секунд до таймаута функции, когда новые каналы уже не берутся
+
+@dataclass
+class JobsSettings:
+    # "sync" — в самом вебхуке, "stream" — в вебхуке с постепенной правкой
+    # заглушки, "async" — через очередь
+    summarize_mode: str
+    queue_url: str
+    access_key: str
+    secret_key: str
+    sqlite_path: str  # только для локального запуска: файл не виден другим контейнерам
+    batch_size: int
+    max_attempts: int = 3  # после стольких неудач пользователь получает сообщение об ошибке
+    stream_edit_interval: float = 1.0  # секунд между правками сообщения при стриминге
+
+@dataclass
+class TopPostsSettings:
+    top_k: int  # постов на канал в ответе /top_posts
+    scan_limit: int  # последних постов канала просматривается при ранжировании
+    pool_size: int  # кандидатов на канал хранится в кэше для ранжирования под ключевые слова
+    cache_ttl: int  # секунд
+    half_life_hours: float  # за сколько часов вес поста падает вдвое
 
 @dataclass
 class Settings:
     bots: Bots
     ydb: YDBSettings
     yandex_gpt: YandexGPTSettings
+    digest: DigestSettings
+    jobs: JobsSettings
+    top_posts: TopPostsSettings
 
 
 def get_settings(env_path: str = ".env") -> Settings:
@@ -38,9 +101,10 @@ def get_settings(env_path: str = ".env") -> Settings:
     ydb_endpoint = os.getenv("YDB_ENDPOINT") or env.str("YDB_ENDPOINT")
     ydb_database = os.getenv("YDB_DATABASE") or env.str("YDB_DATABASE")
 
-    # формируем корректный connection URL для SQLAlchemy с YDB
+    # формируем корректный connection URL для SQLAlchemy с YDB;
+    # DB_URL подменяет YDB другим бэкендом (локальный SQLite для бенчмарков)
     endpoint_clean = ydb_endpoint.replace("grpcs://", "")
-    connection_url = (
+    connection_url = env.str("DB_URL", "") or (
         f"yql+ydb_async://{endpoint_clean}/{ydb_database}"
     )
 
@@ -48,31 +112,84 @@ def get_settings(env_path: str = ".env") -> Settings:
     gpt_catalog = os.getenv("YANDEX_CATALOG_ID") or env.str("YANDEX_CATALOG_ID")
     gpt_key_id = os.getenv("YANDEX_KEY_ID") or env.str("YANDEX_KEY_ID")
     gpt_api_key = os.getenv("YANDEX_API_KEY") or env.str("YANDEX_API_KEY")
-    credentials = ydb.iam.MetadataUrlCredentials()
-    # параметры подключения
-    args = {
-        "_add_declare_for_yql_stmt_vars": True,
-        "connect_args": {
-            "protocol": "grpcs",
-            "credentials": credentials,
-        },
-    }
+
+    # параметры конвейера дайджеста (необязательные)
+    digest = DigestSettings(
+        fetch_concurrency=env.int("DIGEST_FETCH_CONCURRENCY", 4),
+        summarize_concurrency=env.int("DIGEST_SUMMARIZE_CONCURRENCY", 8),
+        deliver_concurrency=env.int("DIGEST_DELIVER_CONCURRENCY", 4),
+        queue_size=env.int("DIGEST_QUEUE_SIZE", 50),
+        fetch_limit=env.int("DIGEST_FETCH_LIMIT", 50),
+        initial_fetch_limit=env.int("DIGEST_INITIAL_FETCH_LIMIT", 5),
+        dedup_days=env.int("DIGEST_DEDUP_DAYS", 3),
+        # лимиты Bot API: ~30 сообщений/с всего и ~1 сообщение/с в один чат
+        delivery_global_rps=env.float("DELIVERY_GLOBAL_RPS", 25.0),
+        delivery_chat_rps=env.float("DELIVERY_CHAT_RPS", 1.0),
+        outbox_max_attempts=env.int("OUTBOX_MAX_ATTEMPTS", 5),
+        shards=env.int("DIGEST_SHARDS", 1),
+        run_period=env.int("DIGEST_RUN_PERIOD", 86400),
+        max_channels=env.int("DIGEST_MAX_CHANNELS", 2000),
+        time_reserve=env.int("DIGEST_TIME_RESERVE", 120),
+    )
+
+    # очередь отложенных заданий /summarize (необязательные)
+    jobs = JobsSettings(
+        summarize_mode=env.str("SUMMARIZE_MODE", "sync"),
+        queue_url=env.str("JOB_QUEUE_URL", ""),
+        access_key=env.str("JOB_QUEUE_ACCESS_KEY", ""),
+        secret_key=env.str("JOB_QUEUE_SECRET_KEY", ""),
+        sqlite_path=env.str("JOB_QUEUE_SQLITE_PATH", ""),
+        batch_size=env.int("JOB_QUEUE_BATCH_SIZE", 10),
+        max_attempts=env.int("JOB_MAX_ATTEMPTS", 3),
+        stream_edit_interval=env.float("STREAM_EDIT_INTERVAL", 1.0),
+    )
+    if jobs.summarize_mode == "async" and not (jobs.queue_url or jobs.sqlite_path):
+        # воркер в другом контейнере не увидит задания, положенные не в YMQ
+        raise ValueError("SUMMARIZE_MODE=async requires JOB_QUEUE_URL (or JOB_QUEUE_SQLITE_PATH for local runs)")
+
+    # ранжирование /top_posts (необязательные)
+    top_posts = TopPostsSettings(
+        top_k=env.int("TOP_POSTS_K", 5),
+        scan_limit=env.int("TOP_POSTS_SCAN_LIMIT", 100),
+        pool_size=env.int("TOP_POSTS_POOL_SIZE", 30),
+        cache_ttl=env.int("TOP_POSTS_CACHE_TTL", 600),
+        half_life_hours=env.float("TOP_POSTS_HALF_LIFE_HOURS", 24.0),
+    )
 
     return Settings(
-        bots=Bots(bot_token=bot_token),
+        bots=Bots(
+            bot_token=bot_token,
+            update_concurrency=env.int("WEBHOOK_UPDATE_CONCURRENCY", 8),
+        ),
         ydb=YDBSettings(
             endpoint=ydb_endpoint,
             database=ydb_database,
             connection_url=connection_url,
-            connection_args=args
         ),
         yandex_gpt=YandexGPTSettings(
             catalog_id=gpt_catalog,
             key_id=gpt_key_id,
-            api_key=gpt_api_key
-        )
+            api_key=gpt_api_key,
+            rps=env.float("YANDEX_GPT_RPS", 10.0),
+            burst=env.float("YANDEX_GPT_BURST", 10.0),
+            max_connections=env.int("YANDEX_GPT_MAX_CONNECTIONS", 20),
+        ),
+        digest=digest,
+        jobs=jobs,
+        top_posts=top_posts,
     )
 
 
+class LazySettings:
+    """Настройки читаются при первом обращении, а не при импорте модуля."""
+
+    _settings: Settings | None = None
+
+    def __getattr__(self, name):
+        if self._settings is None:
+            LazySettings._settings = get_settings()
+        return getattr(self._settings, name)
+
+
 # глобальная переменная для удобного импорта
-settings = get_settings()
\ No newline at end of file
+settings = LazySettings()
\ No newline at end of file
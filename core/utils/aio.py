@@ -0,0 +1,31 @@
+# core/utils/aio.py
+import asyncio
+
+
+class LoopLock:
+    """asyncio.Lock, создаваемый заново для каждого цикла событий.
+
+    Lock привязывается к циклу, в котором его впервые ждали, а синглтоны
+    модулей переживают вызовы функции: каждый asyncio.run — новый цикл.
+    С обычным Lock второй вызов под конкуренцией падает с «is bound to
+    a different event loop».
+    """
+
+    def __init__(self):
+        self._lock: asyncio.Lock | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def _current(self) -> asyncio.Lock:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._lock, self._loop = asyncio.Lock(), loop
+        return self._lock
+
+    def locked(self) -> bool:
+        return self._lock is not None and self._lock.locked()
+
+    async def __aenter__(self):
+        await self._current().acquire()
+
+    async def __aexit__(self, *exc):
+        self._lock.release()
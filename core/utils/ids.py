@@ -0,0 +1,70 @@
+# core/utils/ids.py
+import os
+import random
+import threading
+import time
+
+# 2024-01-01T00:00:00Z в миллисекундах
+EPOCH_MS = 1704067200000
+
+# младшие биты id после миллисекунд
+TAIL_BITS = 22
+MAX_TAIL = (1 << TAIL_BITS) - 1
+# раскладка хвоста при явном WORKER_ID: номер воркера | счётчик
+WORKER_BITS = 10
+SEQUENCE_BITS = TAIL_BITS - WORKER_BITS
+MAX_WORKER = (1 << WORKER_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+
+
+class SnowflakeGenerator:
+    """Монотонные 63-битные id: 41 бит миллисекунд | 22 бита хвоста.
+
+    С явным WORKER_ID хвост — номер воркера и счётчик: до 4096 id
+    в миллисекунду без коллизий. У экземпляров облачной функции стабильного
+    номера нет, а 10 случайных бит на экземпляр совпадают уже у нескольких
+    десятков контейнеров. Поэтому без WORKER_ID каждая миллисекунда начинает
+    счёт со случайного 22-битного смещения: два контейнера столкнутся, только
+    если в одну миллисекунду их диапазоны пересекутся (~n / 4 млн).
+    Когда хвост доходит до конца диапазона, генератор ждёт следующую
+    миллисекунду; при откате системных часов продолжает счёт в последней.
+    """
+
+    def __init__(self, worker_id: int | None = None):
+        if worker_id is None:
+            env_worker = os.getenv("WORKER_ID")
+            worker_id = int(env_worker) if env_worker else None
+        self.worker_id = None if worker_id is None else worker_id & MAX_WORKER
+        self._random = random.SystemRandom()
+        self._last_ms = -1
+        self._tail = 0
+        self._lock = threading.Lock()
+
+    def _start_tail(self) -> int:
+        if self.worker_id is not None:
+            return self.worker_id << SEQUENCE_BITS
+        return self._random.randint(0, MAX_TAIL)
+
+    def _exhausted(self) -> bool:
+        # хвост дошёл до конца диапазона: дальше id перестали бы расти
+        if self.worker_id is not None:
+            return self._tail & MAX_SEQUENCE == MAX_SEQUENCE
+        return self._tail == MAX_TAIL
+
+    def next_id(self) -> int:
+        with self._lock:
+            now = int(time.time() * 1000) - EPOCH_MS
+            if now < self._last_ms:
+                now = self._last_ms
+            if now == self._last_ms and self._exhausted():
+                while now <= self._last_ms:
+                    now = int(time.time() * 1000) - EPOCH_MS
+            if now == self._last_ms:
+                self._tail += 1
+            else:
+                self._tail = self._start_tail()
+            self._last_ms = now
+            return (now << TAIL_BITS) | self._tail
+
+
+id_generator = SnowflakeGenerator()
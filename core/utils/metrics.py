@@ -0,0 +1,162 @@
+# core/utils/metrics.py
+import bisect
+import functools
+import json
+import os
+import re
+import time
+
+from core.utils.utils import logger
+
+# границы корзин гистограмм: длительности в секундах и счётчики (число опросов)
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+COUNT_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34)
+
+_PROM_NAME_RE = re.compile(r"[^a-zA-Z0-9_]")
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами, как в Prometheus."""
+
+    def __init__(self, buckets: tuple = SECONDS_BUCKETS, unit: str = "seconds"):
+        self.buckets = buckets
+        self.unit = unit
+        self.counts = [0] * (len(buckets) + 1)  # последняя — +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """Оценка квантиля сверху: граница корзины, в которую он попал."""
+        rank, seen = q * self.count, 0
+        for bound, n in zip(self.buckets, self.counts):
+            seen += n
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def as_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "max": round(self.max, 6),
+            **{f"p{int(q * 100)}": round(self.quantile(q), 6) for q in (0.5, 0.95, 0.99)},
+        }
+
+
+class _Span:
+    __slots__ = ("metrics", "name", "started")
+
+    def __init__(self, metrics: "Metrics", name: str):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.observe(self.name, time.perf_counter() - self.started)
+        if exc_type is not None:
+            self.metrics.incr(f"{self.name}.errors")
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Metrics:
+    """Счётчики и гистограммы задержек горячих путей в памяти процесса.
+
+    Включается переменной окружения METRICS=json или METRICS=prometheus;
+    report() в конце вызова функции пишет накопленное в лог в этом формате
+    и обнуляет его. Выключенный span() возвращает общий пустой контекст,
+    а timed() при выключенных метриках не оборачивает функцию вовсе.
+    """
+
+    def __init__(self, fmt: str = ""):
+        self.format = fmt.lower()
+        self.enabled = self.format in ("json", "prometheus")
+        self.counters: dict[str, float] = {}
+        self.histograms: dict[str, Histogram] = {}
+
+    def incr(self, name: str, value: float = 1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name: str, value: float, buckets: tuple = SECONDS_BUCKETS, unit: str = "seconds"):
+        if not self.enabled:
+            return
+        hist = self.histograms.get(name)
+        if hist is None:
+            hist = self.histograms[name] = Histogram(buckets, unit)
+        hist.observe(value)
+
+    def span(self, name: str):
+        """with metrics.span("db.ensure_user"): ... — длительность блока и ошибки."""
+        return _Span(self, name) if self.enabled else _NULL_SPAN
+
+    def timed(self, name: str):
+        """Декоратор корутины: её длительность попадает в гистограмму name."""
+        def decorate(fn):
+            if not self.enabled:
+                return fn
+
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                with _Span(self, name):
+                    return await fn(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def as_dict(self) -> dict:
+        return {
+            "counters": dict(sorted(self.counters.items())),
+            "histograms": {name: h.as_dict() for name, h in sorted(self.histograms.items())},
+        }
+
+    def as_prometheus(self, prefix: str = "resumebot") -> str:
+        lines = []
+        for name, value in sorted(self.counters.items()):
+            metric = _PROM_NAME_RE.sub("_", f"{prefix}_{name}_total")
+            lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+        for name, h in sorted(self.histograms.items()):
+            metric = _PROM_NAME_RE.sub("_", f"{prefix}_{name}" + (f"_{h.unit}" if h.unit else ""))
+            lines.append(f"# TYPE {metric} histogram")
+            cumulative = 0
+            for bound, n in zip(h.buckets, h.counts):
+                cumulative += n
+                lines.append(f'{metric}_bucket{{le="{bound}"}} {cumulative}')
+            lines.append(f'{metric}_bucket{{le="+Inf"}} {h.count}')
+            lines += [f"{metric}_sum {h.sum}", f"{metric}_count {h.count}"]
+        return "\n".join(lines)
+
+    def report(self, invocation: str = ""):
+        """Пишет метрики вызова в лог и начинает накопление заново."""
+        if not self.enabled or not (self.counters or self.histograms):
+            return
+        if self.format == "prometheus":
+            logger.info("metrics %s\n%s", invocation, self.as_prometheus())
+        else:
+            logger.info(json.dumps({"metrics": invocation, **self.as_dict()}, ensure_ascii=False))
+        self.counters.clear()
+        self.histograms.clear()
+
+
+metrics = Metrics(os.getenv("METRICS", ""))
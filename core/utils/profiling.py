@@ -0,0 +1,76 @@
+# core/utils/profiling.py
+import builtins
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+from core.utils.utils import logger
+
+
+class StartupProfiler:
+    """Замер времени импорта модулей и шагов инициализации при холодном старте.
+
+    Включается переменной окружения STARTUP_PROFILE=1. Для каждого модуля
+    считается собственное время импорта (без вложенных импортов) и общее.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.imports: dict[str, list[float]] = {}  # module -> [self, total]
+        self.phases: dict[str, float] = {}
+        self._stack: list[float] = []
+        self._original_import = None
+        self._reported = False
+
+    def install(self):
+        if self.enabled:
+            return
+        self.enabled = True
+        self._original_import = builtins.__import__
+        builtins.__import__ = self._timed_import
+
+    def uninstall(self):
+        if self._original_import is not None:
+            builtins.__import__ = self._original_import
+        self.enabled = False
+
+    def _timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level or name in sys.modules:
+            return self._original_import(name, globals, locals, fromlist, level)
+        self._stack.append(0.0)
+        started = time.perf_counter()
+        try:
+            return self._original_import(name, globals, locals, fromlist, level)
+        finally:
+            total = time.perf_counter() - started
+            children = self._stack.pop()
+            if self._stack:
+                self._stack[-1] += total
+            self.imports[name] = [total - children, total]
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            if self.enabled:
+                self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - started
+
+    def report(self, top: int = 25):
+        """Один раз за жизнь контейнера пишет в лог самые дорогие импорты и шаги."""
+        if not self.enabled or self._reported:
+            return
+        self._reported = True
+        ranked = sorted(self.imports.items(), key=lambda kv: kv[1][0], reverse=True)[:top]
+        for name, (self_time, total) in ranked:
+            logger.info("import %-40s self=%7.1fms total=%7.1fms", name, self_time * 1000, total * 1000)
+        for name, seconds in self.phases.items():
+            logger.info("startup %-39s %7.1fms", name, seconds * 1000)
+
+
+startup_profiler = StartupProfiler()
+
+if os.getenv("STARTUP_PROFILE"):
+    startup_profiler.install()
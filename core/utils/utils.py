@@ -1,4 +1,5 @@
 import logging
+import re
 import time
 
 # --- Логирование ---
@@ -11,10 +12,60 @@ logger = logging.getLogger("telegram_summarizer")
 def now_ts() -> int:
     return int(time.time())
 
+def estimate_tokens(text: str) -> int:
+    # Грубая оценка для YandexGPT: ~3 символа кириллицы на токен
+    return len(text) // 3 + 1
+
 def split_into_texts(raw_text: str):
     # Парсим текст: разделяем по пустой строке или по новой строке, убираем whitespace
     parts = [p.strip() for p in raw_text.splitlines() if p.strip()]
     if not parts:
         # если не получилось — вернуть исход как единый текст
         return [raw_text.strip()]
-    return parts
\ No newline at end of file
+    return parts
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?…])\s+")
+
+def chunk_text(raw_text: str, max_tokens: int) -> list[str]:
+    # Склеиваем абзацы из split_into_texts в куски не больше max_tokens.
+    # Слишком длинный абзац режем по предложениям, а предложение — по символам.
+    units = []
+    for part in split_into_texts(raw_text):
+        if estimate_tokens(part) <= max_tokens:
+            units.append(part)
+            continue
+        for sentence in _SENTENCE_RE.split(part):
+            while estimate_tokens(sentence) > max_tokens:
+                cut = (max_tokens - 1) * 3
+                units.append(sentence[:cut])
+                sentence = sentence[cut:]
+            if sentence:
+                units.append(sentence)
+
+    chunks, current, used = [], [], 0
+    for unit in units:
+        cost = estimate_tokens(unit)
+        if current and used + cost > max_tokens:
+            chunks.append("\n".join(current))
+            current, used = [], 0
+        current.append(unit)
+        used += cost
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+_TG_LINK_RE = re.compile(r"^(?:https?://)?(?:www\.)?(?:t|telegram)\.(?:me|dog)/(?:s/)?", re.IGNORECASE)
+
+def normalize_channel(url: str) -> str:
+    # Приводим @name, t.me/name, https://t.me/s/name/123 к виду "name"
+    value = url.strip()
+    if value.startswith("@"):
+        return value[1:].lower()
+    m = _TG_LINK_RE.match(value)
+    if not m:
+        return value.lower()
+    path = value[m.end():].split("?", 1)[0].strip("/")
+    if path.startswith("+") or path.startswith("joinchat/"):
+        # приватные инвайт-ссылки регистрозависимы
+        return path
+    return path.split("/", 1)[0].lower()
@@ -1,9 +1,37 @@
 # digest_runner.py
 import asyncio
+import json
+import time
 from core.settings.settings import settings
-from core.utils.utils import logger
-from services.db import list_channels
-from services.summarize import summarize_text_async
+from core.utils.metrics import metrics
+from core.utils.utils import logger, now_ts
+from services.db import (
+    deactivate_channels,
+    iter_active_channels,
+    load_recent_fingerprints,
+    save_sent_fingerprints,
+    set_channel_watermark,
+)
+from services.summarize import summarize_batch_async
+from services.completion import BATCH
+from services.digest_planner import (
+    ChannelPlan,
+    DigestItem,
+    Post,
+    Story,
+    UserDigest,
+    collect_posts,
+    idle_watermarks,
+    plan_digest,
+    plan_stories,
+)
+from services.delivery import DeliveryScheduler, compose_message_blocks
+from services.digest_shards import ChannelCheckpoints, DigestShard
+from services.pipeline import Pipeline, Stage
+from services.telethon_fetch import ChannelFetcher
+from services.summary_cache import summary_cache
+from core.utils.cache import LRUCache
+from services.top_posts import store_channel_pool
 from aiogram import Bot
 from telethon import TelegramClient
 from telethon.sessions import StringSession
@@ -11,11 +39,197 @@ from telethon.sessions import StringSession
 import aiohttp  # for sending via bot HTTP API if needed
 import os
 
+def _post(message) -> Post:
+    return Post(id=message.id, date=int(message.date.timestamp()) if message.date else 0, text=message.message or "")
+
+def recent_limit() -> int:
+    return max(settings.top_posts.scan_limit, settings.digest.initial_fetch_limit)
+
+# сколько последних загрузок каналов держать для планов со следующих страниц
+RECENT_CHANNELS = 500
+
+class RecentPosts:
+    """Последние посты каналов за прогон: один запрос на канал.
+
+    Подписки одного канала приходят с разных страниц iter_active_channels
+    отдельными планами. Первый план загружает канал, остальные ждут его
+    загрузку и берут посты из неё, так что число запросов к Telegram зависит
+    от числа уникальных каналов, а не страниц. Тот же запрос даёт
+    кандидатов /top_posts — они сохраняются один раз на канал.
+
+    Загрузки хранятся в LRU на RECENT_CHANNELS каналов: популярный канал
+    встречается почти на каждой странице и не вытесняется, а редкий канал,
+    вытесненный до следующей своей подписки, просто загрузится ещё раз.
+    """
+
+    def __init__(self, fetcher: ChannelFetcher, maxsize: int = RECENT_CHANNELS):
+        self.fetcher = fetcher
+        self._loads = LRUCache(maxsize=maxsize)
+
+    async def get(self, plan: ChannelPlan) -> list[Post]:
+        """Последние recent_limit() постов канала, от старых к новым."""
+        load = self._loads.get(plan.key)
+        if load is None:
+            load = asyncio.get_running_loop().create_future()
+            self._loads.set(plan.key, load)
+            try:
+                load.set_result(await self._load(plan))
+            except BaseException as e:
+                # следующий план канала попробует загрузить его сам
+                self._loads.pop(plan.key)
+                load.set_exception(e)
+                load.exception()
+                raise
+        return await asyncio.shield(load)
+
+    async def _load(self, plan: ChannelPlan) -> list[Post]:
+        messages = await self.fetcher.get_messages(plan, limit=recent_limit())
+        try:
+            await store_channel_pool(plan, messages)
+        except Exception as e:
+            logger.warning("Failed to store top posts of %s: %s", plan.key, e)
+        return [_post(m) for m in reversed(messages)]
+
+async def fetch_new_posts(recent: RecentPosts, plan: ChannelPlan) -> list[Post]:
+    """Посты канала, нужные его подписчикам, от старых к новым.
+
+    Каждому подписчику — первые fetch_limit постов после его водяного знака
+    (остаток догрузится следующим запуском, без пропусков), новой подписке —
+    несколько последних. Окна считаются по каждому знаку отдельно: отставший
+    подписчик не сдвигает окно остальных. Обычно хватает общей выборки
+    последних постов канала; свой запрос нужен только знаку, после которого
+    вышло больше постов, чем в уже загруженном.
+    """
+    cfg = settings.digest
+    posts = await recent.get(plan)
+
+    async def fetch_after(watermark: int) -> list[Post]:
+        msgs = await recent.fetcher.get_messages(plan, limit=cfg.fetch_limit, min_id=watermark, reverse=True)
+        return [_post(m) for m in msgs]
+
+    return await collect_posts(plan, posts, len(posts) == recent_limit(), cfg.fetch_limit, fetch_after)
+
 async def fetch_telethon_session_string():
     # пример: читать из Yandex Object Storage или из Secret Manager
     return os.getenv("TELETHON_SESSION_STRING", "")  # или получить из OBS
 
+# сколько историй резюмировать одним пакетным запросом
+STORIES_PER_BATCH = 10
+
+def build_fetch_pipeline(fetcher: ChannelFetcher, fetched: list[DigestItem], checkpoints: ChannelCheckpoints) -> Pipeline:
+    recent = RecentPosts(fetcher)
+
+    async def fetch(plan: ChannelPlan):
+        item = DigestItem(plan=plan, posts=await fetch_new_posts(recent, plan))
+        marks = idle_watermarks(item, settings.digest.initial_fetch_limit, settings.digest.fetch_limit)
+        if marks is not None:
+            # подписчикам нечего отправлять: двигаем знаки и ставим чекпоинт сразу,
+            # не дожидаясь конца загрузки шарда — таймаут не отменит эту работу
+            for sub, post in marks:
+                await set_channel_watermark(sub.channel_id, post.id, post.date)
+            await checkpoints.settle(plan)
+            return None
+        fetched.append(item)
+        return item.posts
+
+    # одновременных запросов к Telegram не больше fetch_concurrency (слоты
+    # ChannelFetcher); воркеров больше, чтобы запросы, запаркованные FloodWait,
+    # не держали очередь остальных каналов
+    return Pipeline(
+        [Stage("fetch", fetch, concurrency=settings.digest.fetch_concurrency * 4)],
+        queue_size=settings.digest.queue_size,
+    )
+
+def build_summarize_pipeline() -> Pipeline:
+    async def summarize(batch: list[Story]):
+        try:
+            summaries = await summarize_batch_async([s.text for s in batch], strategy=BATCH)
+        except Exception as e:
+            for story in batch:
+                story.summary.set_exception(e)
+            raise
+        for story, summary in zip(batch, summaries):
+            if summary is None:
+                # доставка пропустит историю и не сдвинет водяные знаки
+                story.summary.set_exception(RuntimeError("summary is not available"))
+            else:
+                story.summary.set_result(summary)
+        return batch
+
+    return Pipeline(
+        [Stage("summarize", summarize, concurrency=settings.digest.summarize_concurrency)],
+        queue_size=settings.digest.queue_size,
+    )
+
+def build_deliver_pipeline(scheduler: DeliveryScheduler, checkpoints: ChannelCheckpoints | None = None) -> Pipeline:
+    async def deliver(digest: UserDigest):
+        blocks, fingerprints, ok = [], [], True
+        for story, links in digest.entries.items():
+            try:
+                # ждём резюме истории — его параллельно делает summarize-конвейер
+                summary = await story.summary
+            except Exception as e:
+                # посты истории повторит следующий прогон: водяной знак и
+                # отпечаток не сохраняем, чекпоинт канала не ставим
+                logger.error("No summary for user %s story: %s", digest.user_id, e)
+                ok = False
+                continue
+            blocks.append(f"{summary}\nИсточники: {', '.join(links)}")
+            fingerprints.append(story.fingerprint)
+
+        # все истории пользователя — в минимум сообщений до 4096 символов
+        unsent: set[int] = set()
+        for text, indices in compose_message_blocks(blocks, header="📰 Дайджест"):
+            if not await scheduler.send(digest.user_id, text):
+                unsent |= indices
+                ok = False
+
+        if digest.user_id in scheduler.blocked:
+            # пользователь заблокировал бота: повторы бессмысленны, а застрявшие
+            # водяные знаки заставляли бы каждый прогон грузить и резюмировать
+            # его каналы заново — выключаем подписки и закрываем их чекпоинты
+            await deactivate_channels(digest.user_id, [sub.channel_id for sub, _ in digest.watermarks])
+            if checkpoints is not None:
+                await checkpoints.delivered(digest)
+            return digest
+
+        # отпечатки отправленного не дадут повторить истории при перезапуске,
+        # водяные знаки двигаем, только если пользователь получил всё
+        await save_sent_fingerprints(
+            digest.user_id,
+            [fp for i, fp in enumerate(fingerprints) if fp and i not in unsent],
+        )
+        if ok:
+            for sub, post in digest.watermarks:
+                await set_channel_watermark(sub.channel_id, post.id, post.date)
+            if checkpoints is not None:
+                await checkpoints.delivered(digest)
+        return digest
+
+    return Pipeline(
+        [Stage("deliver", deliver, concurrency=settings.digest.deliver_concurrency)],
+        queue_size=settings.digest.queue_size,
+    )
+
+async def run_stories(
+    scheduler: DeliveryScheduler,
+    stories: list[Story],
+    digests: list[UserDigest],
+    checkpoints: ChannelCheckpoints | None = None,
+):
+    """Резюмирование и доставка идут одновременно: доставка пользователю
+    начинается, как только готовы резюме его историй."""
+    batches = [stories[i:i + STORIES_PER_BATCH] for i in range(0, len(stories), STORIES_PER_BATCH)]
+    summarize_task = asyncio.create_task(build_summarize_pipeline().run(batches))
+    try:
+        deliver_stats = await build_deliver_pipeline(scheduler, checkpoints).run(digests)
+    finally:
+        summarize_stats = await summarize_task
+    return summarize_stats + deliver_stats
+
 async def run_digest(event, context):
+    # шард и прогон задаются событием: несколько вызовов делят каналы между собой
+    shard = DigestShard.from_event(event)
     bot = Bot(token=settings.bots.bot_token)
     session_string = await fetch_telethon_session_string()
     if not session_string:
@@ -25,18 +239,98 @@ async def run_digest(event, context):
     api_id = int(os.getenv("TELETHON_API_ID"))
     api_hash = os.getenv("TELETHON_API_HASH")
 
-    async with TelegramClient(StringSession(session_string), api_id, api_hash) as client:
-        channels = await list_channels()
-
-        for ch in channels:
-            # ch is dict: ch["url"], ch["user_id"]
-            msgs = await client.get_messages(ch["url"], limit=5)
-            for m in msgs:
-                text = m.message or ""
-                summary = await summarize_text_async(text)
-                try:
-                    await bot.send_message(ch["user_id"], f"Дайджест по каналу {ch['url']}:\n{summary}")
-                except Exception as e:
-                    logger.exception("Failed to send digest message: %s", e)
-    await bot.session.close()
-    return {"statusCode": 200, "body": "ok"}
\ No newline at end of file
+    # новые каналы перестаём брать заранее: резюмирование и доставку взятых
+    # нужно успеть до таймаута, остальное продолжит следующий вызов шарда
+    deadline = None
+    remaining_ms = getattr(context, "get_remaining_time_in_millis", None)
+    if remaining_ms is not None:
+        deadline = time.monotonic() + remaining_ms() / 1000 - settings.digest.time_reserve
+
+    try:
+        async with TelegramClient(StringSession(session_string), api_id, api_hash) as client:
+            result = await digest(bot, client, shard, deadline)
+    finally:
+        await bot.session.close()
+        metrics.report("digest")
+    return {"statusCode": 200, "body": json.dumps(result)}
+
+
+async def digest(
+    bot: Bot,
+    client: TelegramClient,
+    shard: DigestShard | None = None,
+    deadline: float | None = None,
+) -> dict:
+    """Один шард прогона дайджеста на готовых Bot и TelegramClient (их подменяют бенчмарки).
+
+    Подписки, завершённые в этом прогоне раньше (таймаут, повтор вызова),
+    пропускаются по чекпоинтам. Вызов берёт не больше DIGEST_MAX_CHANNELS
+    каналов и не берёт новые после deadline (time.monotonic()); если что-то
+    осталось, в отчёте checkpoints.complete = False и шард нужно вызвать снова.
+
+    Память не постоянна. Страницы подписок читаются по одной, но
+    кластеризация и дайджест «всё пользователю одним сообщением» требуют
+    видеть весь вызов сразу. Поэтому до кластеризации держатся планы
+    (подписки и индекс ключевых слов) и новые посты каналов, где нашлись
+    совпадения. Каналы без совпадений отпускаются сразу после загрузки.
+    Рабочий набор ограничивают DIGEST_MAX_CHANNELS и число шардов, а не
+    размер таблицы channels.
+    """
+    shard = shard or DigestShard.from_event(None)
+    cfg = settings.digest
+    checkpoints = ChannelCheckpoints(shard, max_channels=cfg.max_channels)
+    scheduler = DeliveryScheduler(
+        bot,
+        global_rps=cfg.delivery_global_rps,
+        chat_rps=cfg.delivery_chat_rps,
+        outbox_max_attempts=cfg.outbox_max_attempts,
+    )
+    # сначала досылаем то, что не ушло в прошлые прогоны; outbox общий,
+    # поэтому его разбирает только нулевой шард
+    if shard.index == 0:
+        with metrics.span("digest.drain_outbox"):
+            await scheduler.drain_outbox()
+    await checkpoints.load()
+    fetcher = ChannelFetcher(client, concurrency=cfg.fetch_concurrency)
+
+    async def shard_plans():
+        # каналы страницы уходят в загрузку, пока читаются следующие страницы;
+        # подписки канала с разных страниц дают отдельные планы того же канала,
+        # но загружается он один раз (RecentPosts)
+        async for page in iter_active_channels():
+            plans = [p for p in plan_digest(page) if checkpoints.wants(p)]
+            if deadline is not None and time.monotonic() > deadline:
+                checkpoints.stop(plans)
+                return
+            await fetcher.preload(plans)
+            for plan in plans:
+                yield plan
+
+    fetched: list[DigestItem] = []
+    with metrics.span("digest.fetch"):
+        stats = await build_fetch_pipeline(fetcher, fetched, checkpoints).run(shard_plans())
+    logger.info(
+        "Digest plan: shard %d/%d, %d channels with matches, %d subscriptions already done, %d deferred",
+        shard.index, shard.count, len(fetched), checkpoints.skipped, checkpoints.deferred,
+    )
+    logger.info("Fetch: %s", fetcher.stats.as_dict())
+
+    # кластеризация почти-дубликатов требует видеть все каналы прогона сразу
+    with metrics.span("digest.cluster"):
+        history = await load_recent_fingerprints(now_ts() - cfg.dedup_days * 86400)
+        stories, digests = plan_stories(fetched, cfg.initial_fetch_limit, history, cfg.fetch_limit)
+    await checkpoints.start(fetched, digests)
+    # дальше нужны только истории и дайджесты: планы и посты каналов отпускаем
+    fetched.clear()
+    logger.info("Digest stories: %d unique for %d users", len(stories), len(digests))
+    with metrics.span("digest.stories"):
+        stats += await run_stories(scheduler, stories, digests, checkpoints)
+
+    logger.info("Summary cache: %s", summary_cache.stats.as_dict())
+    logger.info("Delivery: %s", scheduler.stats.as_dict())
+    return {
+        "stages": [s.as_dict() for s in stats],
+        "summary_cache": summary_cache.stats.as_dict(),
+        "delivery": scheduler.stats.as_dict(),
+        "checkpoints": checkpoints.as_dict(),
+    }
@@ -0,0 +1,189 @@
+# services/completion.py
+import asyncio
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import AsyncIterator
+
+from core.utils.metrics import COUNT_BUCKETS, metrics
+from core.utils.utils import logger
+from services.llm_client import YandexGPTClient
+
+
+def _extract_text(result: dict) -> str:
+    return (
+        result.get("alternatives", [{}])[0]
+        .get("message", {})
+        .get("text", "")
+    ).strip()
+
+
+class LatencyTracker:
+    """Скользящее окно длительностей операций YandexGPT (в секундах)."""
+
+    def __init__(self, window: int = 200, default: float = 1.0):
+        self._samples: deque[float] = deque(maxlen=window)
+        self.default = default
+
+    def observe(self, seconds: float):
+        self._samples.append(seconds)
+
+    def percentile(self, q: float) -> float:
+        if not self._samples:
+            return self.default
+        data = sorted(self._samples)
+        idx = min(len(data) - 1, max(0, round(q * (len(data) - 1))))
+        return data[idx]
+
+
+# только асинхронные операции: быстрые синхронные ответы занижали бы квантили
+# и первая проверка уходила бы слишком рано. Стратегии опроса с разными
+# настройками учатся на одних данных
+operation_latency = LatencyTracker()
+
+
+class CompletionStrategy(ABC):
+    """Способ получить ответ модели для готового тела запроса."""
+
+    @abstractmethod
+    async def complete(self, client: YandexGPTClient, prompt: dict) -> str:
+        ...
+
+
+class SyncCompletion(CompletionStrategy):
+    """Синхронный эндпоинт completion: один запрос, без опроса операции."""
+
+    async def complete(self, client: YandexGPTClient, prompt: dict) -> str:
+        r = await client.post("completion", json=prompt)
+        return _extract_text(r.json().get("result", {}))
+
+
+class StreamingCompletion(CompletionStrategy):
+    """Синхронный completion со stream=true: ответ приходит частями.
+
+    Каждый чанк YandexGPT содержит весь текст, накопленный к этому моменту,
+    поэтому stream() отдаёт текст целиком, а не приращения.
+    """
+
+    async def stream(self, client: YandexGPTClient, prompt: dict) -> AsyncIterator[str]:
+        options = {**prompt.get("completionOptions", {}), "stream": True}
+        started = time.monotonic()
+        first = True
+        async for chunk in client.stream("completion", {**prompt, "completionOptions": options}):
+            text = _extract_text(chunk.get("result", {}))
+            if not text:
+                continue
+            if first:
+                metrics.observe("llm.stream.first_chunk", time.monotonic() - started)
+                first = False
+            yield text
+
+    async def complete(self, client: YandexGPTClient, prompt: dict) -> str:
+        text = ""
+        async for text in self.stream(client, prompt):
+            pass
+        return text
+
+
+@metrics.timed("llm.poll_operation")
+async def _poll_operation(
+    client: YandexGPTClient,
+    operation_id: str,
+    first_delay: float,
+    factor: float,
+    max_delay: float,
+    deadline: float,
+) -> tuple[dict, int]:
+    """Ожидание завершения асинхронной операции YandexGPT.
+
+    Первая проверка через first_delay, дальше интервал растёт в factor раз
+    до max_delay. Возвращает ответ операции и число сделанных GET-запросов.
+    """
+    delay = first_delay
+    polls = 0
+    stop_at = time.monotonic() + deadline
+    while True:
+        await asyncio.sleep(delay)
+        data = await client.get_operation(operation_id)
+        polls += 1
+        if data.get("done"):
+            metrics.observe("llm.poll_operation.polls", polls, buckets=COUNT_BUCKETS, unit="")
+            return data, polls
+        if time.monotonic() + delay >= stop_at:
+            raise TimeoutError("Timeout waiting for Yandex operation")
+        delay = min(max_delay, delay * factor)
+
+
+class AdaptivePolling(CompletionStrategy):
+    """completionAsync + опрос с экспоненциальной задержкой.
+
+    Момент первой проверки подбирается по квантилю quantile наблюдаемых
+    длительностей: ранний квантиль — меньше задержка ответа, поздний —
+    меньше лишних GET-запросов.
+    """
+
+    def __init__(
+        self,
+        quantile: float = 0.5,
+        factor: float = 1.5,
+        min_first: float = 0.2,
+        max_first: float = 2.0,
+        max_delay: float = 4.0,
+        min_deadline: float = 60.0,
+    ):
+        self.quantile = quantile
+        self.factor = factor
+        self.min_first = min_first
+        self.max_first = max_first
+        self.max_delay = max_delay
+        self.min_deadline = min_deadline
+
+    def first_delay(self) -> float:
+        return min(self.max_first, max(self.min_first, operation_latency.percentile(self.quantile)))
+
+    def deadline(self) -> float:
+        # длинные тексты не должны падать по таймауту из-за фиксированного числа попыток
+        return max(self.min_deadline, operation_latency.percentile(0.99) * 3)
+
+    async def complete(self, client: YandexGPTClient, prompt: dict) -> str:
+        started = time.monotonic()
+        r = await client.post("completionAsync", json=prompt)
+        op_id = r.json().get("id")
+        if not op_id:
+            raise RuntimeError("Не удалось получить operation id от YandexGPT")
+
+        data, polls = await _poll_operation(
+            client, op_id,
+            first_delay=self.first_delay(),
+            factor=self.factor,
+            max_delay=self.max_delay,
+            deadline=self.deadline(),
+        )
+        operation_latency.observe(time.monotonic() - started)
+        logger.debug("YandexGPT operation %s done after %d polls", op_id, polls)
+        if data.get("error"):
+            raise RuntimeError(f"YandexGPT operation failed: {data['error']}")
+        return _extract_text(data.get("response", {}))
+
+
+class ShortInputFastPath(CompletionStrategy):
+    """Короткие тексты — синхронным вызовом, остальные — через fallback."""
+
+    def __init__(self, fallback: CompletionStrategy, max_chars: int = 3000):
+        self.sync = SyncCompletion()
+        self.fallback = fallback
+        self.max_chars = max_chars
+
+    async def complete(self, client: YandexGPTClient, prompt: dict) -> str:
+        size = sum(len(m.get("text", "")) for m in prompt.get("messages", []))
+        if size <= self.max_chars:
+            return await self.sync.complete(client, prompt)
+        return await self.fallback.complete(client, prompt)
+
+
+# Интерактивный /summarize: минимальная задержка ответа
+INTERACTIVE = ShortInputFastPath(AdaptivePolling(quantile=0.25, factor=1.4, max_delay=2.0))
+# /summarize в режиме stream: первые слова резюме видны сразу
+STREAMING = StreamingCompletion()
+# Ночной дайджест: меньше запросов к API, задержка не критична
+BATCH = AdaptivePolling(quantile=0.75, factor=2.0, min_first=0.5, max_first=5.0, max_delay=8.0)
@@ -1,17 +1,26 @@
 # services/db.py
 
+import asyncio
+import json
 import time
 from contextlib import asynccontextmanager
-from sqlalchemy import select, Column, String, Text, Boolean, ForeignKey, AsyncAdaptedQueuePool
+from typing import AsyncIterator, Callable
+from sqlalchemy import event, select, insert, update, delete, text, bindparam, Column, String, Text, Boolean, BigInteger, ForeignKey, Index, AsyncAdaptedQueuePool
 from sqlalchemy.orm import relationship, declarative_base
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 
 from core.settings.settings import settings
 from core.utils.utils import logger
+from core.utils.aio import LoopLock
+from core.utils.cache import LRUCache
+from core.utils.ids import id_generator
+from core.utils.metrics import metrics
+from core.utils.profiling import startup_profiler
 
 # YDB
 # from ydb_dbapi import async_connect
 # from ydb_sqlalchemy.sqlalchemy.dbapi_adapter import AdaptedAsyncConnection
+from ydb_sqlalchemy.sqlalchemy import upsert
 from ydb_sqlalchemy.sqlalchemy.types import UInt64
 
 Base = declarative_base()
@@ -32,12 +41,16 @@ class User(Base):
 
 class Channel(Base):
     __tablename__ = "channels"
+    __table_args__ = (Index("ix_channels_user_id", "user_id"),)
     id = Column(UInt64, primary_key=True, autoincrement=True)
     user_id = Column(UInt64, ForeignKey("users.user_id"))
     url = Column(String, nullable=False)
     keywords = Column(Text, nullable=True)
     active = Column(Boolean, default=True)
     created_at = Column(UInt64, default=now_ts)
+    # водяной знак дайджеста: последний доставленный пост канала
+    last_message_id = Column(UInt64, nullable=True)
+    last_message_date = Column(UInt64, nullable=True)
 
     user = relationship("User", back_populates="channels")
 
@@ -49,11 +62,57 @@ class SummaryLog(Base):
     summary_text = Column(Text, nullable=False)
     created_at = Column(UInt64, default=now_ts)
 
+class SentFingerprint(Base):
+    # компактная история отправленного: только отпечаток SimHash, без текста
+    __tablename__ = "sent_fingerprints"
+    id = Column(UInt64, primary_key=True, autoincrement=False)
+    user_id = Column(UInt64, nullable=False)
+    fingerprint = Column(UInt64, nullable=False)
+    created_at = Column(UInt64, default=now_ts)
+
+class OutboxMessage(Base):
+    # сообщения, которые не удалось отправить сразу; досылаются следующими прогонами
+    __tablename__ = "outbox"
+    id = Column(UInt64, primary_key=True, autoincrement=False)
+    chat_id = Column(UInt64, nullable=False)
+    text = Column(Text, nullable=False)
+    attempts = Column(UInt64, default=0)
+    next_attempt_at = Column(UInt64, default=now_ts)
+    created_at = Column(UInt64, default=now_ts)
+
+class ChannelEntity(Base):
+    # разрешённый канал Telegram: без повторных ResolveUsername
+    __tablename__ = "channel_entities"
+    key = Column(String, primary_key=True)  # normalize_channel(url)
+    channel_id = Column(UInt64, nullable=False)
+    access_hash = Column(BigInteger, nullable=False)  # знаковое 64-битное в MTProto
+    updated_at = Column(UInt64, default=now_ts)
+
+class SummaryCacheEntry(Base):
+    __tablename__ = "summaries_cache"
+    key = Column(String, primary_key=True)  # sha256(версия промпта + модель + нормализованный текст)
+    summary_text = Column(Text, nullable=False)
+    created_at = Column(UInt64, default=now_ts)
+
+
+class DigestCheckpoint(Base):
+    # подписка, полностью обработанная в прогоне дайджеста: повтор шарда её пропустит
+    __tablename__ = "digest_checkpoints"
+    run_id = Column(UInt64, primary_key=True, autoincrement=False)
+    channel_id = Column(UInt64, primary_key=True, autoincrement=False)  # Channel.id
+    shard = Column(UInt64, nullable=False)
+    completed_at = Column(UInt64, default=now_ts)
 
-# --- Connection ---
-DB_URL = settings.ydb.connection_url
-DB_ARGS = settings.ydb.connection_args
 
+class ChannelTopPosts(Base):
+    # кандидаты /top_posts, собранные дайджестом: вебхук не ходит в Telegram сам
+    __tablename__ = "channel_top_posts"
+    key = Column(String, primary_key=True)  # normalize_channel(url)
+    posts = Column(Text, nullable=False)  # JSON-список ScoredPost
+    updated_at = Column(UInt64, default=now_ts)
+
+
+# --- Connection ---
 SessionLocal = None
 async def init_session():
     """
@@ -64,7 +123,13 @@ async def init_session():
         return
 
     try:
-        engine = create_async_engine(DB_URL, **DB_ARGS, poolclass=AsyncAdaptedQueuePool)
+        # engine создаётся один раз на контейнер и переживает тёплые вызовы
+        with startup_profiler.phase("db_engine"):
+            engine = create_async_engine(
+                settings.ydb.connection_url,
+                **settings.ydb.connection_args,
+                poolclass=AsyncAdaptedQueuePool,
+            )
         SessionLocal = async_sessionmaker(bind=engine, expire_on_commit=False)
         logger.info("✅ Connected to YDB")
     except Exception as e:
@@ -92,13 +157,51 @@ async def init_session():
 async def async_get_session():
     if SessionLocal is None:
         await init_session()
-    async with SessionLocal() as session:
-        try:
-            yield session
-            await session.commit()
-        except Exception:
-            await session.rollback()
-            raise
+    # db.session — всё время жизни сессии, db.commit — только фиксация
+    with metrics.span("db.session"):
+        async with SessionLocal() as session:
+            try:
+                yield session
+                with metrics.span("db.commit"):
+                    await session.commit()
+            except Exception:
+                await session.rollback()
+                raise
+
+
+def is_ydb() -> bool:
+    return settings.ydb.connection_url.startswith("yql")
+
+
+def upsert_into(table):
+    """UPSERT в YDB; на локальном SQLite (бенчмарки) — INSERT OR REPLACE."""
+    if is_ydb():
+        return upsert(table)
+    return insert(table).prefix_with("OR REPLACE")
+
+
+@asynccontextmanager
+async def session_scope(session: AsyncSession | None = None):
+    """Сессия единицы работы апдейта, если она передана, иначе — своя.
+
+    Переданную сессию коммитит её владелец (DbSessionMiddleware), поэтому
+    хелперы внутри неё только делают flush.
+    """
+    if session is not None:
+        yield session
+        await session.flush()
+    else:
+        async with async_get_session() as s:
+            yield s
+
+
+def after_commit(session: AsyncSession, callback: Callable[[], None]):
+    """Вызывает callback после успешного коммита сессии.
+
+    Кэши в памяти обновляются только по факту записи: при откате единицы
+    работы колбэк не сработает.
+    """
+    event.listen(session.sync_session, "after_commit", lambda _: callback(), once=True)
 
 
 # # --- ORM CRUD functions ---
@@ -183,81 +286,456 @@ async def async_get_session():
 #             return rec
 
 # ensure_user
-async def ensure_user(user_id: int, username: str | None):
-    async with async_get_session() as s:
-        u = await s.get(User, user_id)
-        if u:
-            return u
-        u = User(user_id=user_id, username=username or "", created_at=now_ts())
-        s.add(u)
-        await s.commit()
-        return u
+# Пользователи почти никогда не удаляются, поэтому тёплый контейнер помнит уже
+# виденных и не ходит за ними в YDB. Промах — один идемпотентный UPSERT,
+# который сохраняет исходный created_at существующей записи.
+_ENSURE_USER_SQL = text(
+    "UPSERT INTO users (user_id, username, created_at) "
+    "SELECT :user_id AS user_id, :username AS username, "
+    "COALESCE(MAX(created_at), :now) AS created_at "
+    "FROM users WHERE user_id = :user_id"
+).bindparams(
+    bindparam("user_id", type_=UInt64),
+    bindparam("username", type_=String),
+    bindparam("now", type_=UInt64),
+)
+_ENSURE_USER_SQL_LOCAL = text(
+    "INSERT OR IGNORE INTO users (user_id, username, created_at) VALUES (:user_id, :username, :now)"
+)
+
+
+class KnownUsersCache:
+    def __init__(self, maxsize: int = 50000, ttl: float = 6 * 3600):
+        self._cache = LRUCache(maxsize=maxsize, ttl=ttl)
+        self.hits = 0
+        self.misses = 0
+
+    def seen(self, user_id: int, username: str | None) -> bool:
+        # смена username тоже считается промахом, чтобы запись обновилась
+        if self._cache.get(user_id, False) == (username or ""):
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+
+    def remember(self, user_id: int, username: str | None):
+        self._cache.set(user_id, username or "")
+
+    def as_dict(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            # раньше каждый вызов стоил get + возможный insert
+            "db_round_trips_saved": self.hits,
+        }
+
+
+known_users = KnownUsersCache()
+
+
+@metrics.timed("db.ensure_user")
+async def ensure_user(user_id: int, username: str | None, session: AsyncSession | None = None):
+    if known_users.seen(user_id, username):
+        return
+    async with session_scope(session) as s:
+        await s.execute(_ENSURE_USER_SQL if is_ydb() else _ENSURE_USER_SQL_LOCAL, {"user_id": user_id, "username": username or "", "now": now_ts()})
+        after_commit(s, lambda: known_users.remember(user_id, username))
 
 # set_pending_action
-async def set_pending_action(user_id: int, action: str, payload: str | None = None):
-    async with async_get_session() as s:
-        u = await s.get(User, user_id)
-        if not u:
-            u = User(user_id=user_id, username="", created_at=now_ts())
-            s.add(u)
-        u.pending_action = action
-        u.pending_payload = payload
-        s.add(u)
-        await s.commit()
+# UPSERT в YDB пишет только перечисленные колонки, остальные поля пользователя не трогает
+@metrics.timed("db.set_pending_action")
+async def set_pending_action(user_id: int, action: str, payload: str | None = None, session: AsyncSession | None = None):
+    async with session_scope(session) as s:
+        await s.execute(
+            upsert_into(User.__table__).values(user_id=user_id, pending_action=action, pending_payload=payload)
+        )
 
 # clear_pending_action
-async def clear_pending_action(user_id: int):
-    async with async_get_session() as s:
-        u = await s.get(User, user_id)
-        if u:
-            u.pending_action = None
-            u.pending_payload = None
-            s.add(u)
-            await s.commit()
+@metrics.timed("db.clear_pending_action")
+async def clear_pending_action(user_id: int, session: AsyncSession | None = None):
+    async with session_scope(session) as s:
+        await s.execute(
+            update(User).where(User.user_id == user_id).values(pending_action=None, pending_payload=None)
+        )
 
 # add_channel_for_user
-async def add_channel_for_user(user_id: int, url: str, keywords: list[str]):
-    async with async_get_session() as s:
-        u = await s.get(User, user_id)
-        if not u:
-            raise ValueError("User not found")
-        ch = Channel(user=u, url=url, keywords=",".join(keywords), active=True, created_at=now_ts())
+@metrics.timed("db.add_channel_for_user")
+async def add_channel_for_user(user_id: int, url: str, keywords: list[str], session: AsyncSession | None = None):
+    async with session_scope(session) as s:
+        # пользователь уже создан ensure_user в той же единице работы — повторный get не нужен
+        ch = Channel(user_id=user_id, url=url, keywords=",".join(keywords), active=True, created_at=now_ts())
         s.add(ch)
-        await s.commit()
-        return ch
+        after_commit(s, lambda: _user_channels_cache.pop(user_id))
+    return ch
+
+# iter_active_channels
+CHANNELS_PAGE_SIZE = 1000
+
+_ACTIVE_CHANNEL_COLUMNS = (Channel.id, Channel.user_id, Channel.url, Channel.keywords, Channel.last_message_id)
+
+
+async def iter_active_channels(page_size: int = CHANNELS_PAGE_SIZE) -> AsyncIterator[list[dict]]:
+    """Активные подписки страницами по page_size, по возрастанию id.
+
+    Keyset-пагинация (id > последнего id страницы) вместо OFFSET: каждая
+    страница — короткий запрос по диапазону первичного ключа, читаются
+    только нужные колонки, без ORM-объектов. Сессия на время обработки
+    страницы вызывающим не удерживается.
+    """
+    last_id = 0
+    while True:
+        with metrics.span("db.channels_page"):
+            async with async_get_session() as s:
+                result = await s.execute(
+                    select(*_ACTIVE_CHANNEL_COLUMNS)
+                    .where(Channel.active == True, Channel.id > last_id)
+                    .order_by(Channel.id)
+                    .limit(page_size)
+                )
+                page = [
+                    {
+                        "id": row.id,
+                        "user_id": row.user_id,
+                        "url": row.url,
+                        "keywords": row.keywords.split(",") if row.keywords else [],
+                        "last_message_id": row.last_message_id or 0,
+                    }
+                    for row in result
+                ]
+        if not page:
+            return
+        last_id = page[-1]["id"]
+        yield page
+        if len(page) < page_size:
+            return
+
 
 # list_channels
+@metrics.timed("db.list_channels")
 async def list_channels():
-    async with async_get_session() as s:
-        result = await s.execute(select(Channel).where(Channel.active == True))
-        channels_objs = result.scalars().all()
+    return [ch async for page in iter_active_channels() for ch in page]
+
+
+# list_channels_for_user
+# YDB использует вторичный индекс только при явном VIEW, поэтому запрос текстовый.
+# Читаем только нужные колонки, без создания ORM-объектов.
+_USER_CHANNELS_SQL = text(
+    "SELECT id, url, keywords FROM channels VIEW ix_channels_user_id "
+    "WHERE user_id = :user_id AND active = true"
+).bindparams(bindparam("user_id", type_=UInt64))
+_USER_CHANNELS_SQL_LOCAL = text(
+    "SELECT id, url, keywords FROM channels WHERE user_id = :user_id AND active = 1"
+)
+
+# короткий TTL: у другого экземпляра функции кэш сбросится сам
+_user_channels_cache = LRUCache(maxsize=10000, ttl=60)
+
+@metrics.timed("db.list_channels_for_user")
+async def list_channels_for_user(user_id: int, session: AsyncSession | None = None) -> list[dict]:
+    cached = _user_channels_cache.get(user_id)
+    if cached is not None:
+        return cached
+    async with session_scope(session) as s:
+        sql = _USER_CHANNELS_SQL if is_ydb() else _USER_CHANNELS_SQL_LOCAL
+        result = await s.execute(sql, {"user_id": user_id})
         channels = [
             {
-                "id": ch.id,
-                "user_id": ch.user_id,
-                "url": ch.url,
-                "keywords": ch.keywords.split(",") if ch.keywords else []
+                "id": row.id,
+                "user_id": user_id,
+                "url": row.url,
+                "keywords": row.keywords.split(",") if row.keywords else [],
             }
-            for ch in channels_objs
+            for row in result
         ]
-        return channels
+    _user_channels_cache.set(user_id, channels)
+    return channels
 
 
-# save_summary
-async def save_summary(user_id: int, original: str, summary: str):
+# set_channel_watermark
+@metrics.timed("db.set_channel_watermark")
+async def set_channel_watermark(channel_id: int, message_id: int, message_date: int):
     async with async_get_session() as s:
-        return await inner_save_summary(s, user_id, original, summary)
+        await s.execute(
+            update(Channel)
+            .where(Channel.id == channel_id)
+            .values(last_message_id=message_id, last_message_date=message_date)
+        )
+
+
+# deactivate_channels
+# по первичному ключу: подписки пользователя известны из дайджеста, скан по user_id не нужен
+@metrics.timed("db.deactivate_channels")
+async def deactivate_channels(user_id: int, channel_ids: list[int]):
+    if not channel_ids:
+        return
+    async with async_get_session() as s:
+        await s.execute(update(Channel).where(Channel.id.in_(channel_ids)).values(active=False))
+        after_commit(s, lambda: _user_channels_cache.pop(user_id))
+
+
+# --- Write-behind журнал резюме ---
+class SummaryLogWriter:
+    """Буфер записей SummaryLog с пакетной записью.
+
+    Записи копятся в памяти и уходят одним bulk UPSERT, когда набирается
+    max_batch штук или самой старой записи исполняется max_age секунд.
+    В конце каждого вызова функции буфер нужно сбросить через close():
+    замороженный контейнер может больше не проснуться.
+    """
 
+    def __init__(self, max_batch: int = 200, max_age: float = 5.0):
+        self.max_batch = max_batch
+        self.max_age = max_age
+        self._buffer: list[dict] = []
+        self._timer: asyncio.Task | None = None
+        self._flushing: asyncio.Task | None = None
+        self._lock = LoopLock()
+
+    def add(self, user_id: int, original: str, summary: str) -> int:
+        rec_id = id_generator.next_id()
+        self._buffer.append({
+            "id": rec_id,
+            "user_id": user_id,
+            "original_text": original,
+            "summary_text": summary,
+            "created_at": now_ts(),
+        })
+        if len(self._buffer) >= self.max_batch and (self._flushing is None or self._flushing.done()):
+            self._flushing = self._spawn(self.flush())
+        elif self._timer is None or self._timer.done():
+            self._timer = self._spawn(self._flush_later())
+        return rec_id
+
+    @staticmethod
+    def _spawn(coro) -> asyncio.Task:
+        task = asyncio.get_running_loop().create_task(coro)
+        task.add_done_callback(_log_flush_error)
+        return task
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.max_age)
+        await self.flush()
+
+    @metrics.timed("db.summary_log_flush")
+    async def flush(self):
+        async with self._lock:
+            if not self._buffer:
+                return
+            batch, self._buffer = self._buffer, []
+            try:
+                async with async_get_session() as s:
+                    await s.execute(upsert_into(SummaryLog.__table__), batch)
+            except Exception:
+                # возвращаем записи в буфер: следующий flush попробует снова
+                self._buffer[:0] = batch
+                raise
+
+    async def close(self):
+        if self._timer is not None and not self._timer.done():
+            self._timer.cancel()
+        if self._flushing is not None and not self._flushing.done():
+            # ошибку фонового сброса уже залогировал колбэк, записи вернулись в буфер
+            await asyncio.gather(self._flushing, return_exceptions=True)
+        await self.flush()
+
+
+def _log_flush_error(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Summary log flush failed: %s", task.exception())
+
+
+summary_log = SummaryLogWriter()
 
+
+# save_summary
+@metrics.timed("db.save_summary")
+async def save_summary(user_id: int, original: str, summary: str) -> int:
+    # запись откладывается в буфер, id выдаётся сразу
+    return summary_log.add(user_id, original, summary)
+
+
+@metrics.timed("db.inner_save_summary")
 async def inner_save_summary(session: AsyncSession, user_id: int, original: str, summary: str):
     rec = SummaryLog(
-        id=int(now_ts() * 1000),
+        id=id_generator.next_id(),
         user_id=user_id,
         original_text=original,
         summary_text=summary,
         created_at=now_ts(),
     )
     session.add(rec)
-    await session.commit()
     return rec
-        
\ No newline at end of file
+
+
+# get_cached_summary
+@metrics.timed("db.get_cached_summary")
+async def get_cached_summary(key: str) -> str | None:
+    async with async_get_session() as s:
+        rec = await s.get(SummaryCacheEntry, key)
+        return rec.summary_text if rec else None
+
+
+# put_cached_summary
+@metrics.timed("db.put_cached_summary")
+async def put_cached_summary(key: str, summary: str):
+    # один UPSERT без предварительного SELECT: гонка двух записей одного ключа безопасна
+    async with async_get_session() as s:
+        await s.execute(
+            upsert_into(SummaryCacheEntry.__table__).values(key=key, summary_text=summary, created_at=now_ts())
+        )
+
+
+# load_recent_fingerprints
+@metrics.timed("db.load_recent_fingerprints")
+async def load_recent_fingerprints(since_ts: int) -> dict[int, list[int]]:
+    """Отпечатки, отправленные после since_ts, по пользователям.
+
+    Читает таблицу целиком: её размер ограничивает TTL (migrations/004).
+    """
+    async with async_get_session() as s:
+        result = await s.execute(
+            select(SentFingerprint.user_id, SentFingerprint.fingerprint)
+            .where(SentFingerprint.created_at >= since_ts)
+        )
+        history: dict[int, list[int]] = {}
+        for user_id, fp in result:
+            history.setdefault(user_id, []).append(fp)
+        return history
+
+
+# save_sent_fingerprints
+@metrics.timed("db.save_sent_fingerprints")
+async def save_sent_fingerprints(user_id: int, fingerprints: list[int]):
+    if not fingerprints:
+        return
+    ts = now_ts()
+    async with async_get_session() as s:
+        await s.execute(
+            upsert_into(SentFingerprint.__table__),
+            [
+                {"id": id_generator.next_id(), "user_id": user_id, "fingerprint": fp, "created_at": ts}
+                for fp in fingerprints
+            ],
+        )
+
+
+# enqueue_outbox
+@metrics.timed("db.enqueue_outbox")
+async def enqueue_outbox(chat_id: int, text: str, attempts: int = 0, delay: int = 0):
+    async with async_get_session() as s:
+        s.add(OutboxMessage(
+            id=id_generator.next_id(),
+            chat_id=chat_id,
+            text=text,
+            attempts=attempts,
+            next_attempt_at=now_ts() + delay,
+            created_at=now_ts(),
+        ))
+
+
+# list_due_outbox
+@metrics.timed("db.list_due_outbox")
+async def list_due_outbox(limit: int = 500) -> list[dict]:
+    async with async_get_session() as s:
+        result = await s.execute(
+            select(OutboxMessage.id, OutboxMessage.chat_id, OutboxMessage.text, OutboxMessage.attempts)
+            .where(OutboxMessage.next_attempt_at <= now_ts())
+            .limit(limit)
+        )
+        return [dict(row._mapping) for row in result]
+
+
+# reschedule_outbox
+@metrics.timed("db.reschedule_outbox")
+async def reschedule_outbox(message_id: int, attempts: int, delay: int):
+    async with async_get_session() as s:
+        await s.execute(
+            update(OutboxMessage)
+            .where(OutboxMessage.id == message_id)
+            .values(attempts=attempts, next_attempt_at=now_ts() + delay)
+        )
+
+
+# delete_outbox
+@metrics.timed("db.delete_outbox")
+async def delete_outbox(message_id: int):
+    async with async_get_session() as s:
+        await s.execute(delete(OutboxMessage).where(OutboxMessage.id == message_id))
+
+
+# get_channel_entities
+@metrics.timed("db.get_channel_entities")
+async def get_channel_entities(keys: list[str]) -> dict[str, tuple[int, int]]:
+    if not keys:
+        return {}
+    async with async_get_session() as s:
+        result = await s.execute(
+            select(ChannelEntity.key, ChannelEntity.channel_id, ChannelEntity.access_hash)
+            .where(ChannelEntity.key.in_(keys))
+        )
+        return {key: (channel_id, access_hash) for key, channel_id, access_hash in result}
+
+
+# save_channel_entity
+@metrics.timed("db.save_channel_entity")
+async def save_channel_entity(key: str, channel_id: int, access_hash: int):
+    async with async_get_session() as s:
+        await s.execute(
+            upsert_into(ChannelEntity.__table__).values(
+                key=key, channel_id=channel_id, access_hash=access_hash, updated_at=now_ts()
+            )
+        )
+
+
+# delete_channel_entity
+@metrics.timed("db.delete_channel_entity")
+async def delete_channel_entity(key: str):
+    async with async_get_session() as s:
+        await s.execute(delete(ChannelEntity).where(ChannelEntity.key == key))
+
+
+# --- Кандидаты /top_posts ---
+@metrics.timed("db.load_channel_top_posts")
+async def load_channel_top_posts(keys: list[str]) -> dict[str, list[dict]]:
+    if not keys:
+        return {}
+    async with async_get_session() as s:
+        result = await s.execute(
+            select(ChannelTopPosts.key, ChannelTopPosts.posts).where(ChannelTopPosts.key.in_(keys))
+        )
+        return {key: json.loads(posts) for key, posts in result}
+
+
+@metrics.timed("db.save_channel_top_posts")
+async def save_channel_top_posts(key: str, posts: list[dict]):
+    async with async_get_session() as s:
+        await s.execute(
+            upsert_into(ChannelTopPosts.__table__).values(
+                key=key, posts=json.dumps(posts, ensure_ascii=False), updated_at=now_ts()
+            )
+        )
+
+
+# --- Чекпоинты дайджеста ---
+@metrics.timed("db.load_digest_checkpoints")
+async def load_digest_checkpoints(run_id: int, shard: int) -> set[int]:
+    async with async_get_session() as s:
+        result = await s.execute(
+            select(DigestCheckpoint.channel_id)
+            .where(DigestCheckpoint.run_id == run_id, DigestCheckpoint.shard == shard)
+        )
+        return set(result.scalars())
+
+
+@metrics.timed("db.save_digest_checkpoints")
+async def save_digest_checkpoints(run_id: int, shard: int, channel_ids: list[int]):
+    if not channel_ids:
+        return
+    ts = now_ts()
+    async with async_get_session() as s:
+        await s.execute(
+            upsert_into(DigestCheckpoint.__table__),
+            [{"run_id": run_id, "channel_id": cid, "shard": shard, "completed_at": ts} for cid in channel_ids],
+        )
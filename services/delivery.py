@@ -0,0 +1,240 @@
+# services/delivery.py
+import asyncio
+import time
+from dataclasses import dataclass, asdict
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+
+from core.utils.cache import LRUCache
+from core.utils.metrics import metrics
+from core.utils.ratelimit import TokenBucket
+from core.utils.utils import logger
+from services.db import delete_outbox, enqueue_outbox, list_due_outbox, reschedule_outbox
+
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+
+def compose_message_blocks(
+    blocks: list[str], header: str = "", limit: int = TELEGRAM_MESSAGE_LIMIT
+) -> list[tuple[str, set[int]]]:
+    """Склеивает блоки в минимум сообщений не длиннее limit.
+
+    Блоки не разрываются, пока помещаются целиком; слишком длинный блок
+    режется по строкам, а строка — по символам. Возвращает сообщения
+    с номерами блоков, части которых в них попали.
+    """
+    pieces: list[tuple[str, int]] = []
+    for i, block in enumerate(blocks):
+        if len(block) <= limit:
+            pieces.append((block, i))
+            continue
+        current = ""
+        for line in block.splitlines():
+            if current and len(current) + 1 + len(line) > limit:
+                pieces.append((current, i))
+                current = ""
+            while len(line) > limit:
+                pieces.append((line[:limit], i))
+                line = line[limit:]
+            current = f"{current}\n{line}" if current else line
+        if current:
+            pieces.append((current, i))
+
+    messages, current, indices = [], header, set()
+    for piece, i in pieces:
+        candidate = f"{current}\n\n{piece}" if current else piece
+        if len(candidate) > limit and current and current != header:
+            messages.append((current, indices))
+            candidate, indices = piece, set()
+        elif len(candidate) > limit:
+            # даже с одним блоком шапка не влезает — отправляем блок без неё
+            candidate = piece
+        current = candidate
+        indices.add(i)
+    if current and current != header:
+        messages.append((current, indices))
+    return messages
+
+
+def compose_messages(blocks: list[str], header: str = "", limit: int = TELEGRAM_MESSAGE_LIMIT) -> list[str]:
+    """Тексты сообщений compose_message_blocks."""
+    return [text for text, _ in compose_message_blocks(blocks, header, limit)]
+
+
+class ProgressiveMessage:
+    """Постепенная правка отправленного сообщения по мере генерации текста.
+
+    Telegram ограничивает частоту правок, поэтому сообщение меняется не
+    чаще interval секунд: тексты, пришедшие между правками, пропускаются,
+    показывается самый свежий. Первая правка уходит сразу.
+    """
+
+    def __init__(self, bot: Bot, chat_id: int, message_id: int, interval: float = 1.0, cursor: str = " ▌"):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.interval = interval
+        self.cursor = cursor
+        self.edits = 0
+        self._shown = ""
+        self._next_edit_at = 0.0
+
+    async def _edit(self, text: str) -> bool:
+        """True — в сообщении этот текст, False — правка не удалась."""
+        text = text[:TELEGRAM_MESSAGE_LIMIT]
+        if text == self._shown:
+            return True
+        try:
+            with metrics.span("bot.edit_message_text"):
+                await self.bot.edit_message_text(text, chat_id=self.chat_id, message_id=self.message_id)
+        except TelegramRetryAfter as e:
+            self._next_edit_at = time.monotonic() + e.retry_after
+            return False
+        except TelegramBadRequest as e:
+            # «message is not modified» — текст уже такой; остальное — сообщение недоступно
+            if "not modified" not in str(e):
+                logger.warning("Failed to edit message %s in chat %s: %s", self.message_id, self.chat_id, e)
+                return False
+        except (TelegramNetworkError, TelegramServerError) as e:
+            logger.warning("Transient edit error for chat %s: %s", self.chat_id, e)
+            return False
+        self._shown = text
+        self.edits += 1
+        self._next_edit_at = time.monotonic() + self.interval
+        return True
+
+    async def update(self, text: str):
+        """Промежуточный текст: показывается, только если подошло время правки."""
+        if text and time.monotonic() >= self._next_edit_at:
+            await self._edit(text[:TELEGRAM_MESSAGE_LIMIT - len(self.cursor)] + self.cursor)
+
+    async def finish(self, text: str, max_attempts: int = 3):
+        """Итоговый текст. Не влезший в одно сообщение хвост и текст, который не
+        удалось вписать правкой, уходят новыми сообщениями."""
+        parts = compose_messages([text]) or [text]
+        for _ in range(max_attempts):
+            await asyncio.sleep(max(0.0, self._next_edit_at - time.monotonic()))
+            if await self._edit(parts[0]):
+                break
+        else:
+            await self.bot.send_message(self.chat_id, parts[0])
+        for part in parts[1:]:
+            await self.bot.send_message(self.chat_id, part)
+
+
+@dataclass
+class DeliveryStats:
+    sent: int = 0
+    retried: int = 0
+    flood_waits: int = 0
+    queued: int = 0
+    dropped: int = 0
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+class DeliveryScheduler:
+    """Отправка через Bot API в рамках глобального и поканального лимитов.
+
+    На TelegramRetryAfter ждёт ровно retry_after и притормаживает нужный
+    лимитер. Сообщение, которое не ушло за max_attempts попыток, попадает
+    в таблицу outbox и досылается следующими прогонами (drain_outbox).
+    Чаты, заблокировавшие бота, собираются в blocked: туда больше не шлём.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        global_rps: float = 25.0,
+        chat_rps: float = 1.0,
+        max_attempts: int = 3,
+        outbox_max_attempts: int = 5,
+    ):
+        self.bot = bot
+        self.global_bucket = TokenBucket(global_rps)
+        self.chat_rps = chat_rps
+        self.max_attempts = max_attempts
+        self.outbox_max_attempts = outbox_max_attempts
+        self._chat_buckets = LRUCache(maxsize=10000)
+        self.stats = DeliveryStats()
+        self.blocked: set[int] = set()
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(self.chat_rps, capacity=1.0)
+            self._chat_buckets.set(chat_id, bucket)
+        return bucket
+
+    async def _try_send(self, chat_id: int, text: str) -> bool | None:
+        """True — отправлено, None — стоит повторить, False — повторять бессмысленно."""
+        chat_bucket = self._chat_bucket(chat_id)
+        await chat_bucket.acquire()
+        await self.global_bucket.acquire()
+        try:
+            with metrics.span("bot.send_message"):
+                await self.bot.send_message(chat_id, text)
+            return True
+        except TelegramRetryAfter as e:
+            self.stats.flood_waits += 1
+            logger.warning("Flood wait %ss for chat %s", e.retry_after, chat_id)
+            chat_bucket.pause(e.retry_after)
+            return None
+        except TelegramForbiddenError as e:
+            # бот заблокирован или удалён из чата
+            logger.warning("Chat %s blocked the bot: %s", chat_id, e)
+            self.blocked.add(chat_id)
+            return False
+        except TelegramBadRequest as e:
+            # чат не найден или текст некорректен
+            logger.warning("Dropping message for chat %s: %s", chat_id, e)
+            return False
+        except (TelegramNetworkError, TelegramServerError) as e:
+            logger.warning("Transient send error for chat %s: %s", chat_id, e)
+            await asyncio.sleep(1)
+            return None
+
+    async def send(self, chat_id: int, text: str) -> bool:
+        """Отправить сообщение. False — сообщение не ушло и не будет дослано.
+
+        Сообщение, отложенное в outbox, считается принятым к доставке (True).
+        """
+        if chat_id in self.blocked:
+            self.stats.dropped += 1
+            return False
+        for attempt in range(self.max_attempts):
+            result = await self._try_send(chat_id, text)
+            if result is True:
+                self.stats.sent += 1
+                return True
+            if result is False:
+                self.stats.dropped += 1
+                return False
+            self.stats.retried += 1
+        await enqueue_outbox(chat_id, text, attempts=self.max_attempts, delay=60)
+        self.stats.queued += 1
+        return True
+
+    async def drain_outbox(self, limit: int = 500):
+        """Досылка отложенных сообщений с экспоненциальной паузой между попытками."""
+        for msg in await list_due_outbox(limit):
+            result = await self._try_send(msg["chat_id"], msg["text"])
+            attempts = msg["attempts"] + 1
+            if result is True:
+                self.stats.sent += 1
+                await delete_outbox(msg["id"])
+            elif result is False or attempts >= self.outbox_max_attempts:
+                self.stats.dropped += 1
+                logger.error("Giving up on outbox message %s for chat %s", msg["id"], msg["chat_id"])
+                await delete_outbox(msg["id"])
+            else:
+                self.stats.retried += 1
+                await reschedule_outbox(msg["id"], attempts, delay=60 * 2 ** attempts)
@@ -0,0 +1,261 @@
+# services/digest_planner.py
+import asyncio
+import zlib
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Iterable
+
+from core.utils.utils import normalize_channel
+from services.keywords import KeywordIndex
+from services.similarity import FingerprintIndex, simhash
+
+
+@dataclass
+class Subscription:
+    # одна строка Channel: подписка пользователя на канал
+    channel_id: int
+    user_id: int
+    url: str
+    keywords: list[str]
+    last_message_id: int = 0
+
+
+@dataclass
+class ChannelPlan:
+    # уникальный канал и все его подписчики
+    key: str
+    url: str
+    subscribers: list[Subscription] = field(default_factory=list)
+    # ключевые слова всех подписчиков канала, владелец — channel_id подписки
+    keywords: KeywordIndex = field(default_factory=KeywordIndex)
+
+    @property
+    def watermarks(self) -> list[int]:
+        # различные водяные знаки подписчиков по возрастанию;
+        # новые подписки (без знака) обходятся последними постами
+        return sorted({s.last_message_id for s in self.subscribers if s.last_message_id})
+
+    def link(self, message_id: int) -> str:
+        # у приватных каналов (инвайт-ссылки) нет публичных ссылок на посты
+        if self.key.startswith("+") or self.key.startswith("joinchat/"):
+            return self.url
+        return f"https://t.me/{self.key}/{message_id}"
+
+
+@dataclass
+class Post:
+    id: int
+    date: int
+    text: str
+
+
+class PostWindow:
+    """Загруженные посты канала и диапазоны id, внутри которых загружено всё.
+
+    Диапазон (after, upto] — после поста after до поста upto включительно,
+    upto = None — до последнего поста канала. По диапазонам видно, хватает ли
+    уже загруженного подписчику с данным водяным знаком или для него нужен
+    свой запрос.
+    """
+
+    def __init__(self):
+        self._posts: dict[int, Post] = {}
+        self._spans: list[tuple[int, int | None]] = []
+
+    def add(self, posts: list[Post], after: int, to_end: bool):
+        """posts — все посты канала после after (до конца канала, если to_end)."""
+        for p in posts:
+            self._posts[p.id] = p
+        upto = None if to_end or not posts else posts[-1].id
+        self._spans.append((after, upto))
+
+    def covers(self, watermark: int, limit: int) -> bool:
+        """Загружены ли первые limit постов после watermark (или все, если их меньше)."""
+        for after, upto in self._spans:
+            if after > watermark:
+                continue
+            if upto is None or sum(1 for pid in self._posts if watermark < pid <= upto) >= limit:
+                return True
+        return False
+
+    def posts(self) -> list[Post]:
+        return [self._posts[pid] for pid in sorted(self._posts)]
+
+
+async def collect_posts(
+    plan: ChannelPlan,
+    recent: list[Post],
+    recent_full: bool,
+    fetch_limit: int,
+    fetch_after: Callable[[int], Awaitable[list[Post]]],
+) -> list[Post]:
+    """Посты канала, нужные всем его подписчикам, от старых к новым.
+
+    recent — последние посты канала (recent_full: выборка упёрлась в лимит,
+    и до неё могут быть ещё посты). Для водяного знака, которому их не
+    хватает, вызывается fetch_after(знак): первые fetch_limit постов после него.
+    """
+    window = PostWindow()
+    window.add(recent, after=recent[0].id - 1 if recent_full and recent else 0, to_end=True)
+    for watermark in plan.watermarks:
+        if window.covers(watermark, fetch_limit):
+            continue
+        fetched = await fetch_after(watermark)
+        window.add(fetched, after=watermark, to_end=len(fetched) < fetch_limit)
+    return window.posts()
+
+
+@dataclass
+class DigestItem:
+    # уникальный канал и его новые посты
+    plan: ChannelPlan
+    posts: list[Post]
+
+
+@dataclass(eq=False)
+class Story:
+    # кластер почти-дубликатов: резюмируется один раз по представителю
+    text: str
+    fingerprint: int
+    summary: asyncio.Future = field(default_factory=lambda: asyncio.get_running_loop().create_future())
+
+
+@dataclass
+class UserDigest:
+    user_id: int
+    # история и ссылки на неё из каналов, на которые подписан пользователь
+    entries: dict[Story, list[str]] = field(default_factory=dict)
+    # до какого поста двигать водяные знаки после успешной доставки
+    watermarks: list[tuple[Subscription, Post]] = field(default_factory=list)
+
+
+def shard_of(key: str, shards: int) -> int:
+    """Шард канала: стабильный между процессами хэш ключа канала по модулю shards.
+
+    Шардируем по ключу, а не по id строки, чтобы все подписки на канал
+    попали в один шард и канал загружался один раз.
+    """
+    return zlib.crc32(key.encode("utf-8")) % shards if shards > 1 else 0
+
+
+def plan_digest(channels: Iterable[dict]) -> list[ChannelPlan]:
+    """Группирует активные подписки по каналу.
+
+    Каждый канал попадает в план один раз, поэтому загрузка и резюмирование
+    масштабируются по числу уникальных каналов, а не подписок.
+    """
+    plans: dict[str, ChannelPlan] = {}
+    for ch in channels:
+        key = normalize_channel(ch["url"])
+        plan = plans.get(key)
+        if plan is None:
+            plan = plans[key] = ChannelPlan(key=key, url=ch["url"])
+        sub = Subscription(
+            channel_id=ch["id"],
+            user_id=ch["user_id"],
+            url=ch["url"],
+            keywords=ch["keywords"],
+            last_message_id=ch.get("last_message_id", 0),
+        )
+        plan.subscribers.append(sub)
+        plan.keywords.add(sub.channel_id, sub.keywords)
+    for plan in plans.values():
+        plan.keywords.compile()
+    return list(plans.values())
+
+
+def subscriber_posts(sub: Subscription, posts: list[Post], initial_limit: int, fetch_limit: int | None = None) -> list[Post]:
+    # новые для подписчика посты: первые fetch_limit после его водяного знака,
+    # новой подписке — последние; окно у каждого подписчика своё
+    if sub.last_message_id:
+        return [p for p in posts if p.id > sub.last_message_id][:fetch_limit]
+    return posts[-initial_limit:]
+
+
+def idle_watermarks(
+    item: DigestItem,
+    initial_limit: int,
+    fetch_limit: int | None = None,
+) -> list[tuple[Subscription, Post]] | None:
+    """Водяные знаки канала, в новых постах которого никому ничего не нашлось.
+
+    None — хотя бы одному подписчику есть что отправить, и канал нужен
+    кластеризации. Иначе подписки можно завершить сразу после загрузки.
+    """
+    plan = item.plan
+    matched: dict[int, set] = {}
+    marks = []
+    for sub in plan.subscribers:
+        posts = subscriber_posts(sub, item.posts, initial_limit, fetch_limit)
+        if not posts:
+            continue
+        for p in posts:
+            if not p.text:
+                continue
+            if p.id not in matched:
+                matched[p.id] = plan.keywords.match(p.text)
+            if sub.channel_id in matched[p.id]:
+                return None
+        marks.append((sub, posts[-1]))
+    return marks
+
+
+def plan_stories(
+    items: Iterable[DigestItem],
+    initial_limit: int,
+    history: dict[int, list[int]] | None = None,
+    fetch_limit: int | None = None,
+) -> tuple[list[Story], list[UserDigest]]:
+    """Раскладывает загруженные посты на истории и дайджесты пользователей.
+
+    Посты, совпавшие по ключевым словам хотя бы у одного подписчика,
+    кластеризуются по SimHash через все каналы прогона: каждая история
+    резюмируется один раз и перечисляет все источники. Истории, близкие к уже
+    отправленным пользователю за последние дни (history), ему не повторяются.
+    """
+    stories_index = FingerprintIndex()
+    stories: list[Story] = []
+    digests: dict[int, UserDigest] = {}
+    history_index: dict[int, FingerprintIndex] = {}
+    for user_id, fps in (history or {}).items():
+        index = history_index[user_id] = FingerprintIndex()
+        for fp in fps:
+            index.add(fp, True)
+
+    for item in items:
+        plan = item.plan
+        matched: dict[int, set] = {}
+        story_of: dict[int, Story] = {}
+        for sub in plan.subscribers:
+            posts = subscriber_posts(sub, item.posts, initial_limit, fetch_limit)
+            if not posts:
+                continue
+            digest = digests.setdefault(sub.user_id, UserDigest(user_id=sub.user_id))
+            digest.watermarks.append((sub, posts[-1]))
+            user_history = history_index.get(sub.user_id)
+            for p in posts:
+                if not p.text:
+                    continue
+                # один проход автомата по посту на весь канал
+                if p.id not in matched:
+                    matched[p.id] = plan.keywords.match(p.text)
+                if sub.channel_id not in matched[p.id]:
+                    continue
+                story = story_of.get(p.id)
+                if story is None:
+                    fp = simhash(p.text)
+                    story = stories_index.find(fp) if fp else None
+                    if story is None:
+                        story = Story(text=p.text, fingerprint=fp)
+                        stories.append(story)
+                        if fp:
+                            stories_index.add(fp, story)
+                    story_of[p.id] = story
+                if user_history is not None and story.fingerprint and story.fingerprint in user_history:
+                    continue
+                links = digest.entries.setdefault(story, [])
+                if plan.link(p.id) not in links:
+                    links.append(plan.link(p.id))
+
+    # резюмировать имеет смысл только истории, которые кому-то отправим
+    wanted = {story for d in digests.values() for story in d.entries}
+    return [s for s in stories if s in wanted], list(digests.values())
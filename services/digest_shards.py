@@ -0,0 +1,132 @@
+# services/digest_shards.py
+import json
+from dataclasses import dataclass, asdict
+
+from core.settings.settings import settings
+from core.utils.utils import logger, now_ts
+from services.db import load_digest_checkpoints, save_digest_checkpoints
+from services.digest_planner import ChannelPlan, DigestItem, UserDigest, shard_of
+
+
+@dataclass
+class DigestShard:
+    """Часть прогона дайджеста, которую обрабатывает один вызов функции.
+
+    run_id объединяет повторы одного прогона: по умолчанию это номер периода
+    DIGEST_RUN_PERIOD, поэтому перезапуск шарда в тот же день продолжит
+    с чекпоинтов, а завтрашний прогон начнёт заново.
+    """
+    index: int = 0
+    count: int = 1
+    run_id: int = 0
+
+    @classmethod
+    def from_event(cls, event: dict | None) -> "DigestShard":
+        """Шард из события: поля shard, shards, run_id на верхнем уровне,
+        в теле HTTP-запроса или в payload таймера (JSON)."""
+        params = dict(event or {})
+        # формат события таймера в Yandex Cloud Functions: messages[i].details.payload
+        payloads = [(m.get("details") or {}).get("payload") for m in params.get("messages") or []]
+        for raw in (params.get("body"), (params.get("details") or {}).get("payload"), *payloads):
+            if isinstance(raw, str) and raw.strip().startswith("{"):
+                params.update(json.loads(raw))
+        cfg = settings.digest
+        count = int(params.get("shards") or cfg.shards)
+        index = int(params.get("shard") or 0)
+        if not 0 <= index < count:
+            raise ValueError(f"shard {index} is out of range for {count} shards")
+        run_id = int(params.get("run_id") or now_ts() // cfg.run_period)
+        return cls(index=index, count=count, run_id=run_id)
+
+    def owns(self, plan: ChannelPlan) -> bool:
+        return shard_of(plan.key, self.count) == self.index
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+class ChannelCheckpoints:
+    """Чекпоинты подписок шарда в YDB.
+
+    Отмечаются подписки (строки Channel), а не каналы: подписки одного канала
+    приходят с разных страниц, и каждую можно завершить, как только её
+    пользователь получил всё нужное. Подписка без подходящих постов
+    завершается сразу после загрузки канала, остальные — после доставки
+    дайджеста пользователю. Повтор шарда в том же прогоне пропускает
+    завершённые подписки, а канал без незавершённых подписок не загружает.
+
+    Вызов берёт не больше max_channels новых каналов: остальное остаётся
+    следующему вызову шарда (complete = False в отчёте).
+    """
+
+    def __init__(self, shard: DigestShard, max_channels: int = 0):
+        self.shard = shard
+        self.max_channels = max_channels
+        self.skipped = 0
+        self.deferred = 0
+        self.stopped = False
+        self.completed = 0
+        self._done: set[int] = set()
+        self._taken: set[str] = set()
+
+    async def load(self):
+        self._done = await load_digest_checkpoints(self.shard.run_id, self.shard.index)
+
+    @property
+    def complete(self) -> bool:
+        return not self.deferred and not self.stopped
+
+    def wants(self, plan: ChannelPlan) -> bool:
+        """План канала этого шарда без завершённых подписок; False — не загружать сейчас."""
+        if not self.shard.owns(plan):
+            return False
+        subscribers = [s for s in plan.subscribers if s.channel_id not in self._done]
+        self.skipped += len(plan.subscribers) - len(subscribers)
+        if not subscribers:
+            return False
+        if plan.key not in self._taken and self.max_channels and len(self._taken) >= self.max_channels:
+            self.deferred += len(subscribers)
+            return False
+        plan.subscribers = subscribers
+        self._taken.add(plan.key)
+        return True
+
+    def stop(self, plans: list[ChannelPlan]):
+        """Время вызова кончилось: эти планы и непрочитанные страницы — следующему вызову."""
+        self.stopped = True
+        self.deferred += sum(len(p.subscribers) for p in plans)
+
+    async def settle(self, plan: ChannelPlan):
+        """Канал загружен, и его подписчикам нечего отправлять — завершаем сразу."""
+        await self._complete([s.channel_id for s in plan.subscribers])
+
+    async def start(self, fetched: list[DigestItem], digests: list[UserDigest]):
+        """Завершает подписки загруженных каналов, которым не досталось новых постов."""
+        waiting = {sub.channel_id for digest in digests for sub, _ in digest.watermarks}
+        await self._complete([
+            sub.channel_id
+            for item in fetched
+            for sub in item.plan.subscribers
+            if sub.channel_id not in waiting
+        ])
+
+    async def delivered(self, digest: UserDigest):
+        """Пользователь получил всё: его подписки из дайджеста завершены."""
+        await self._complete([sub.channel_id for sub, _ in digest.watermarks])
+
+    async def _complete(self, channel_ids: list[int]):
+        try:
+            await save_digest_checkpoints(self.shard.run_id, self.shard.index, channel_ids)
+            self.completed += len(channel_ids)
+        except Exception as e:
+            # без чекпоинта подписка просто обработается повторно — не валим доставку
+            logger.warning("Failed to checkpoint %d subscriptions: %s", len(channel_ids), e)
+
+    def as_dict(self) -> dict:
+        return {
+            **self.shard.as_dict(),
+            "skipped": self.skipped,
+            "deferred": self.deferred,
+            "completed": self.completed,
+            "complete": self.complete,
+        }
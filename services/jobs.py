@@ -0,0 +1,186 @@
+# services/jobs.py
+import asyncio
+import json
+import sqlite3
+import time
+import uuid
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, asdict, field
+
+from core.settings.settings import settings
+from core.utils.aio import LoopLock
+from core.utils.utils import logger, now_ts
+
+
+@dataclass
+class SummarizeJob:
+    # отложенное резюмирование для /summarize
+    chat_id: int
+    user_id: int
+    text: str
+    placeholder_message_id: int | None = None
+    job_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    created_at: int = field(default_factory=now_ts)
+    attempts: int = 0  # неудачных попыток обработки
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self), ensure_ascii=False)
+
+    @classmethod
+    def from_json(cls, raw: str) -> "SummarizeJob":
+        return cls(**json.loads(raw))
+
+
+@dataclass
+class ReceivedJob:
+    job: SummarizeJob
+    receipt: str  # чем подтверждать обработку в конкретной очереди
+
+
+class JobQueue(ABC):
+    """Интерфейс очереди заданий на резюмирование."""
+
+    @abstractmethod
+    async def put(self, job: SummarizeJob):
+        ...
+
+    @abstractmethod
+    async def get_batch(self, max_items: int = 10) -> list[ReceivedJob]:
+        ...
+
+    @abstractmethod
+    async def ack(self, received: list[ReceivedJob]):
+        ...
+
+
+class SQLiteJobQueue(JobQueue):
+    """Локальная очередь в SQLite: для тестов и запуска без облака.
+
+    Взятое задание становится невидимым на visibility_timeout секунд;
+    если его не подтвердили, оно снова попадёт в выдачу. Как и в SQS,
+    квитанция действует только для одной выдачи: задание, заново
+    положенное в очередь с тем же job_id, старой квитанцией не удалить.
+    """
+
+    def __init__(self, path: str = ":memory:", visibility_timeout: int = 120):
+        self.visibility_timeout = visibility_timeout
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = LoopLock()
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, body TEXT NOT NULL, visible_at REAL NOT NULL)"
+        )
+
+    async def _run(self, fn, *args):
+        async with self._lock:
+            return await asyncio.to_thread(fn, *args)
+
+    def _put(self, job: SummarizeJob):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO jobs (id, body, visible_at) VALUES (?, ?, ?)",
+            (job.job_id, job.to_json(), time.time()),
+        )
+
+    def _take(self, max_items: int) -> list[ReceivedJob]:
+        now = time.time()
+        cur = self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = cur.execute(
+                "SELECT id, body FROM jobs WHERE visible_at <= ? ORDER BY visible_at LIMIT ?",
+                (now, max_items),
+            ).fetchall()
+            hidden_until = now + self.visibility_timeout
+            cur.executemany(
+                "UPDATE jobs SET visible_at = ? WHERE id = ?",
+                [(hidden_until, r[0]) for r in rows],
+            )
+            cur.execute("COMMIT")
+        except Exception:
+            cur.execute("ROLLBACK")
+            raise
+        return [
+            ReceivedJob(job=SummarizeJob.from_json(body), receipt=f"{job_id}@{hidden_until!r}")
+            for job_id, body in rows
+        ]
+
+    def _delete(self, receipts: list[str]):
+        self._conn.executemany(
+            "DELETE FROM jobs WHERE id = ? AND visible_at = ?",
+            [(job_id, float(stamp)) for job_id, stamp in (r.rsplit("@", 1) for r in receipts)],
+        )
+
+    async def put(self, job: SummarizeJob):
+        await self._run(self._put, job)
+
+    async def get_batch(self, max_items: int = 10) -> list[ReceivedJob]:
+        return await self._run(self._take, max_items)
+
+    async def ack(self, received: list[ReceivedJob]):
+        await self._run(self._delete, [r.receipt for r in received])
+
+
+class MessageQueueJobQueue(JobQueue):
+    """Yandex Message Queue через SQS-совместимый API (нужен boto3).
+
+    В проде воркер обычно запускается триггером очереди и получает сообщения
+    прямо в event; get_batch нужен для ручного дренажа.
+    """
+
+    ENDPOINT = "https://message-queue.api.cloud.yandex.net"
+
+    def __init__(self, queue_url: str, access_key: str, secret_key: str, region: str = "ru-central1"):
+        try:
+            import boto3
+        except ImportError as e:
+            raise RuntimeError("Для MessageQueueJobQueue нужен пакет boto3") from e
+        self.queue_url = queue_url
+        self._sqs = boto3.client(
+            "sqs",
+            endpoint_url=self.ENDPOINT,
+            region_name=region,
+            aws_access_key_id=access_key,
+            aws_secret_access_key=secret_key,
+        )
+
+    async def put(self, job: SummarizeJob):
+        await asyncio.to_thread(self._sqs.send_message, QueueUrl=self.queue_url, MessageBody=job.to_json())
+
+    async def get_batch(self, max_items: int = 10) -> list[ReceivedJob]:
+        resp = await asyncio.to_thread(
+            self._sqs.receive_message,
+            QueueUrl=self.queue_url,
+            MaxNumberOfMessages=min(max_items, 10),
+            WaitTimeSeconds=1,
+        )
+        return [
+            ReceivedJob(job=SummarizeJob.from_json(m["Body"]), receipt=m["ReceiptHandle"])
+            for m in resp.get("Messages", [])
+        ]
+
+    async def ack(self, received: list[ReceivedJob]):
+        if not received:
+            return
+        entries = [{"Id": str(i), "ReceiptHandle": r.receipt} for i, r in enumerate(received)]
+        await asyncio.to_thread(self._sqs.delete_message_batch, QueueUrl=self.queue_url, Entries=entries)
+
+
+_job_queue: JobQueue | None = None
+
+
+def get_job_queue() -> JobQueue:
+    """Очередь по настройкам: YMQ, если задан JOB_QUEUE_URL.
+
+    SQLite — только по явному JOB_QUEUE_SQLITE_PATH для локального запуска
+    и тестов: файл в /tmp контейнера вебхука воркеру недоступен.
+    """
+    global _job_queue
+    if _job_queue is None:
+        cfg = settings.jobs
+        if cfg.queue_url:
+            _job_queue = MessageQueueJobQueue(cfg.queue_url, cfg.access_key, cfg.secret_key)
+        elif cfg.sqlite_path:
+            _job_queue = SQLiteJobQueue(cfg.sqlite_path)
+        else:
+            raise RuntimeError("Job queue is not configured: set JOB_QUEUE_URL")
+        logger.info("Job queue: %s", type(_job_queue).__name__)
+    return _job_queue
@@ -0,0 +1,119 @@
+# services/keywords.py
+import re
+from collections import deque
+from functools import lru_cache
+from typing import Hashable, Iterable
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+# Окончания для упрощённого стемминга (в духе Snowball), от длинных к коротким
+_RU_SUFFIXES = sorted(
+    {
+        "иями", "ями", "ами", "ией", "ием", "ему", "ого", "ими", "ыми", "его",
+        "ая", "яя", "ое", "ее", "ие", "ые", "ой", "ей", "ий", "ый", "ом", "ем", "ам",
+        "ям", "ах", "ях", "ую", "юю", "ов", "ев", "ия", "ье", "ью",
+        "а", "я", "о", "е", "и", "ы", "у", "ю", "ь", "й",
+    },
+    key=len,
+    reverse=True,
+)
+_EN_SUFFIXES = ("ing", "ed", "es", "s")
+_MIN_STEM = 3
+
+
+def fold(text: str) -> str:
+    """Регистронезависимая форма с учётом русского «ё»."""
+    return text.casefold().replace("ё", "е")
+
+
+def stem(word: str) -> str:
+    suffixes = _EN_SUFFIXES if word.isascii() else _RU_SUFFIXES
+    for suffix in suffixes:
+        if word.endswith(suffix) and len(word) - len(suffix) >= _MIN_STEM:
+            return word[: -len(suffix)]
+    return word
+
+
+def normalize(text: str) -> str:
+    """Текст как последовательность основ, обрамлённая пробелами.
+
+    Пробелы по краям позволяют искать ключевые слова строго по границам слов.
+    """
+    return " " + " ".join(stem(w) for w in _WORD_RE.findall(fold(text))) + " "
+
+
+class KeywordIndex:
+    """Набор ключевых слов многих владельцев в одном автомате Ахо-Корасик.
+
+    Владелец — любой hashable (например, id подписки). Поиск проходит текст
+    один раз и возвращает всех владельцев, чьё хотя бы одно слово встретилось.
+    Владельцы без ключевых слов совпадают с любым текстом.
+    """
+
+    def __init__(self):
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        self._out: list[set[Hashable]] = [set()]
+        self._match_all: set[Hashable] = set()
+        self._compiled = True
+
+    def add(self, owner: Hashable, keywords: Iterable[str]):
+        patterns = [normalize(kw) for kw in keywords]
+        patterns = [p for p in patterns if p.strip()]
+        if not patterns:
+            self._match_all.add(owner)
+            return
+        for pattern in patterns:
+            state = 0
+            for ch in pattern:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(set())
+                state = nxt
+            self._out[state].add(owner)
+        self._compiled = False
+
+    def compile(self) -> "KeywordIndex":
+        # BFS по бору: строим суффиксные ссылки и объединяем выходы
+        queue = deque(self._goto[0].values())
+        for s in queue:
+            self._fail[s] = 0
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                f = self._fail[state]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[nxt] = self._goto[f].get(ch, 0)
+                self._out[nxt] |= self._out[self._fail[nxt]]
+        self._compiled = True
+        return self
+
+    def match(self, text: str) -> set[Hashable]:
+        if not self._compiled:
+            self.compile()
+        found = set(self._match_all)
+        state = 0
+        for ch in normalize(text):
+            while state and ch not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(ch, 0)
+            if self._out[state]:
+                found |= self._out[state]
+        return found
+
+    def matches(self, text: str) -> bool:
+        return bool(self.match(text))
+
+
+@lru_cache(maxsize=1024)
+def compile_keywords(keywords: tuple[str, ...]) -> KeywordIndex:
+    """Скомпилированный фильтр для одного списка ключевых слов (кэшируется)."""
+    index = KeywordIndex()
+    index.add(0, keywords)
+    return index.compile()
@@ -0,0 +1,208 @@
+# services/llm_client.py
+import asyncio
+import importlib.util
+import json
+import random
+from dataclasses import dataclass
+from typing import AsyncIterator
+
+import httpx
+
+from core.settings.settings import settings
+from core.utils.metrics import metrics
+from core.utils.ratelimit import TokenBucket
+from core.utils.utils import logger
+
+BASE_URL = "https://llm.api.cloud.yandex.net/foundationModels/v1"
+OPERATION_URL = "https://operation.api.cloud.yandex.net/operations"
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+@dataclass
+class RetryPolicy:
+    """Повторы с экспоненциальной задержкой и full jitter."""
+    max_attempts: int = 4
+    base_delay: float = 0.5
+    max_delay: float = 8.0
+
+    def delay(self, attempt: int, retry_after: float | None = None) -> float:
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+class RetryBudget:
+    """Глобальный бюджет повторов.
+
+    Каждый обычный запрос пополняет бюджет на ratio, каждый повтор тратит
+    один токен. Так доля повторов не превышает ratio от общего трафика,
+    и шторм 429/5xx не умножает нагрузку на API.
+    """
+
+    def __init__(self, ratio: float = 0.2, min_tokens: float = 5.0, max_tokens: float = 50.0):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self._tokens = min_tokens
+
+    def deposit(self):
+        self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        if self._tokens >= 1.0:
+            self._tokens -= 1.0
+            return True
+        return False
+
+
+def _retry_after(response: httpx.Response) -> float | None:
+    value = response.headers.get("Retry-After")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class YandexGPTClient:
+    """Долгоживущий клиент YandexGPT.
+
+    Держит пул keep-alive соединений (HTTP/2, если установлен h2),
+    ограничивает частоту запросов под квоту каталога и повторяет
+    упавшие запросы в пределах общего бюджета.
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        catalog_id: str,
+        rps: float = 10.0,
+        burst: float | None = None,
+        max_connections: int = 20,
+        timeout: float = 30.0,
+        retry_policy: RetryPolicy | None = None,
+        retry_budget: RetryBudget | None = None,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ):
+        self.api_key = api_key
+        self.catalog_id = catalog_id
+        self.limiter = TokenBucket(rps, burst)
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.retry_budget = retry_budget or RetryBudget()
+        self._limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+            keepalive_expiry=60.0,
+        )
+        self._timeout = httpx.Timeout(timeout)
+        self._http2 = importlib.util.find_spec("h2") is not None
+        # подменяется в бенчмарках фейковым сервером YandexGPT
+        self._transport = transport
+        self._client: httpx.AsyncClient | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    @property
+    def headers(self) -> dict:
+        return {"Content-Type": "application/json", "Authorization": f"Api-Key {self.api_key}"}
+
+    def model_uri(self, model: str = "yandexgpt-lite") -> str:
+        return f"gpt://{self.catalog_id}/{model}"
+
+    def _http(self) -> httpx.AsyncClient:
+        # Соединения привязаны к event loop: если рантайм создал новый цикл
+        # между вызовами функции, пул приходится пересоздать.
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed or self._loop is not loop:
+            self._client = httpx.AsyncClient(
+                headers=self.headers,
+                limits=self._limits,
+                timeout=self._timeout,
+                http2=self._http2,
+                transport=self._transport,
+            )
+            self._loop = loop
+        return self._client
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """Запрос с ограничением частоты и повторами. Возвращает успешный ответ
+        или бросает httpx.HTTPStatusError / httpx.TransportError."""
+        self.retry_budget.deposit()
+        # llm.http.completion, llm.http.completionAsync, llm.http.operation
+        span = "llm.http." + (url.rsplit("/", 1)[-1] if url.startswith(BASE_URL) else "operation")
+        attempt = 0
+        while True:
+            await self.limiter.acquire()
+            try:
+                with metrics.span(span):
+                    r = await self._http().request(method, url, **kwargs)
+            except httpx.TransportError as e:
+                if not self._can_retry(attempt):
+                    raise
+                delay = self.retry_policy.delay(attempt)
+                logger.warning("YandexGPT transport error %s, retry in %.2fs", e, delay)
+            else:
+                if r.status_code not in RETRY_STATUSES:
+                    r.raise_for_status()
+                    return r
+                retry_after = _retry_after(r)
+                if r.status_code == 429:
+                    # квота исчерпана — притормаживаем всех, а не только этот запрос
+                    self.limiter.pause(retry_after or self.retry_policy.base_delay)
+                if not self._can_retry(attempt):
+                    r.raise_for_status()
+                delay = self.retry_policy.delay(attempt, retry_after)
+                logger.warning("YandexGPT responded %s, retry in %.2fs", r.status_code, delay)
+            attempt += 1
+            metrics.incr("llm.retries")
+            await asyncio.sleep(delay)
+
+    def _can_retry(self, attempt: int) -> bool:
+        return attempt + 1 < self.retry_policy.max_attempts and self.retry_budget.withdraw()
+
+    async def post(self, path: str, json: dict) -> httpx.Response:
+        return await self.request("POST", f"{BASE_URL}/{path}", json=json)
+
+    async def stream(self, path: str, body: dict) -> AsyncIterator[dict]:
+        """POST с потоковым ответом: по одному JSON-объекту на строку.
+
+        Повторов нет — часть ответа к этому моменту могла уже уйти
+        пользователю; решение о запасном пути принимает вызывающий.
+        """
+        self.retry_budget.deposit()
+        await self.limiter.acquire()
+        with metrics.span("llm.http.stream"):
+            async with self._http().stream("POST", f"{BASE_URL}/{path}", json=body) as r:
+                if r.status_code == 429:
+                    self.limiter.pause(_retry_after(r) or self.retry_policy.base_delay)
+                if r.is_error:
+                    await r.aread()
+                    r.raise_for_status()
+                async for line in r.aiter_lines():
+                    if line.strip():
+                        yield json.loads(line)
+
+    async def get_operation(self, operation_id: str) -> dict:
+        r = await self.request("GET", f"{OPERATION_URL}/{operation_id}")
+        return r.json()
+
+    async def aclose(self):
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+
+
+_llm_client: YandexGPTClient | None = None
+
+
+def get_llm_client() -> YandexGPTClient:
+    """Общий клиент на весь процесс: переживает тёплые вызовы функции."""
+    global _llm_client
+    if _llm_client is None:
+        cfg = settings.yandex_gpt
+        _llm_client = YandexGPTClient(
+            api_key=cfg.api_key,
+            catalog_id=cfg.catalog_id,
+            rps=cfg.rps,
+            burst=cfg.burst,
+            max_connections=cfg.max_connections,
+        )
+    return _llm_client
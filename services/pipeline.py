@@ -0,0 +1,149 @@
+# services/pipeline.py
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterable, Awaitable, Callable, Iterable
+
+from core.utils.metrics import metrics
+from core.utils.utils import logger
+
+# Маркер завершения потока для воркеров стадии
+_DONE = object()
+
+
+@dataclass
+class Stage:
+    """Описание стадии конвейера.
+
+    handler получает элемент и возвращает результат для следующей стадии.
+    None означает «отбросить элемент». При fan_out=True результат
+    воспринимается как набор элементов и раскладывается поштучно.
+    """
+    name: str
+    handler: Callable[[Any], Awaitable[Any]]
+    concurrency: int = 1
+    fan_out: bool = False
+
+
+@dataclass
+class StageStats:
+    name: str
+    concurrency: int
+    received: int = 0
+    emitted: int = 0
+    failed: int = 0
+    busy_time: float = 0.0
+    started_at: float = field(default_factory=time.monotonic)
+    finished_at: float = 0.0
+
+    @property
+    def elapsed(self) -> float:
+        end = self.finished_at or time.monotonic()
+        return max(end - self.started_at, 1e-9)
+
+    @property
+    def throughput(self) -> float:
+        """Обработанных элементов в секунду за время жизни стадии."""
+        return self.received / self.elapsed
+
+    def as_dict(self) -> dict:
+        return {
+            "stage": self.name,
+            "concurrency": self.concurrency,
+            "received": self.received,
+            "emitted": self.emitted,
+            "failed": self.failed,
+            "elapsed_s": round(self.elapsed, 3),
+            "busy_s": round(self.busy_time, 3),
+            "throughput_per_s": round(self.throughput, 2),
+        }
+
+
+class Pipeline:
+    """Конвейер из стадий, соединённых ограниченными asyncio.Queue.
+
+    Каждая стадия обслуживается своим пулом воркеров. Очереди ограничены
+    queue_size, поэтому быстрая стадия упирается в медленную (backpressure)
+    и не накапливает в памяти весь набор данных.
+    """
+
+    def __init__(self, stages: list[Stage], queue_size: int = 100):
+        if not stages:
+            raise ValueError("Pipeline requires at least one stage")
+        self.stages = stages
+        self.queue_size = queue_size
+
+    async def run(self, source: Iterable | AsyncIterable) -> list[StageStats]:
+        queues = [asyncio.Queue(maxsize=self.queue_size) for _ in self.stages]
+        stats = [StageStats(name=s.name, concurrency=s.concurrency) for s in self.stages]
+
+        workers: list[list[asyncio.Task]] = []
+        for i, stage in enumerate(self.stages):
+            out_q = queues[i + 1] if i + 1 < len(queues) else None
+            workers.append([
+                asyncio.create_task(self._worker(stage, stats[i], queues[i], out_q))
+                for _ in range(max(1, stage.concurrency))
+            ])
+
+        try:
+            await self._feed(source, queues[0])
+            await self._close(queues[0], self.stages[0].concurrency)
+            for i, stage_workers in enumerate(workers):
+                await asyncio.gather(*stage_workers)
+                stats[i].finished_at = time.monotonic()
+                if i + 1 < len(self.stages):
+                    await self._close(queues[i + 1], self.stages[i + 1].concurrency)
+        finally:
+            for stage_workers in workers:
+                for t in stage_workers:
+                    if not t.done():
+                        t.cancel()
+
+        for s in stats:
+            logger.info(
+                "Pipeline stage %s: %d in / %d out / %d failed, %.2f items/s",
+                s.name, s.received, s.emitted, s.failed, s.throughput,
+            )
+        return stats
+
+    @staticmethod
+    async def _feed(source, queue: asyncio.Queue):
+        if hasattr(source, "__aiter__"):
+            async for item in source:
+                await queue.put(item)
+        else:
+            for item in source:
+                await queue.put(item)
+
+    @staticmethod
+    async def _close(queue: asyncio.Queue, concurrency: int):
+        for _ in range(max(1, concurrency)):
+            await queue.put(_DONE)
+
+    @staticmethod
+    async def _worker(stage: Stage, stats: StageStats, in_q: asyncio.Queue, out_q: asyncio.Queue | None):
+        while True:
+            item = await in_q.get()
+            if item is _DONE:
+                return
+            stats.received += 1
+            started = time.monotonic()
+            try:
+                result = await stage.handler(item)
+            except Exception as e:
+                stats.failed += 1
+                metrics.incr(f"stage.{stage.name}.errors")
+                logger.exception("Pipeline stage %s failed: %s", stage.name, e)
+                continue
+            finally:
+                busy = time.monotonic() - started
+                stats.busy_time += busy
+                metrics.observe(f"stage.{stage.name}", busy)
+
+            if result is None:
+                continue
+            results = result if stage.fan_out else (result,)
+            for r in results:
+                stats.emitted += 1
+                if out_q is not None:
+                    await out_q.put(r)
@@ -0,0 +1,80 @@
+# services/ranking.py
+import heapq
+import math
+from dataclasses import dataclass
+from typing import Callable, Iterable, TypeVar
+
+T = TypeVar("T")
+
+
+@dataclass(frozen=True)
+class RankingWeights:
+    # вклад метрик вовлечённости (по логарифму, чтобы вирусный пост не заслонял всё)
+    views: float = 1.0
+    forwards: float = 3.0
+    reactions: float = 2.0
+    # пост с ключевым словом пользователя весит в (1 + keyword_boost) раз больше
+    keyword_boost: float = 1.0
+    half_life_hours: float = 24.0
+
+
+@dataclass
+class ScoredPost:
+    score: float  # вовлечённость с учётом давности, без ключевых слов
+    message_id: int
+    date: int
+    text: str
+    link: str
+
+
+def reaction_count(message) -> int:
+    reactions = getattr(message, "reactions", None)
+    if not reactions or not reactions.results:
+        return 0
+    return sum(r.count for r in reactions.results)
+
+
+def base_score(message, now: float, weights: RankingWeights) -> float:
+    """Вовлечённость поста, затухающая вдвое каждые half_life_hours."""
+    engagement = (
+        weights.views * math.log1p(message.views or 0)
+        + weights.forwards * math.log1p(message.forwards or 0)
+        + weights.reactions * math.log1p(reaction_count(message))
+    )
+    age_hours = max(0.0, now - message.date.timestamp()) / 3600 if message.date else 0.0
+    return engagement * 0.5 ** (age_hours / weights.half_life_hours)
+
+
+def top_k(items: Iterable[T], k: int, key: Callable[[T], float]) -> list[T]:
+    """k лучших элементов за один проход, по убыванию key.
+
+    Держит кучу из k элементов вместо сортировки всего набора: O(n log k)
+    по времени и O(k) по памяти, поэтому годится для потока сообщений.
+    """
+    if k <= 0:
+        return []
+    heap: list[tuple[float, int, T]] = []
+    for seq, item in enumerate(items):
+        # seq разрешает равенство очков, не сравнивая сами элементы
+        entry = (key(item), -seq, item)
+        if len(heap) < k:
+            heapq.heappush(heap, entry)
+        elif entry[:2] > heap[0][:2]:
+            heapq.heapreplace(heap, entry)
+    return [item for _, _, item in sorted(heap, key=lambda e: e[:2], reverse=True)]
+
+
+def rank_messages(messages: Iterable, link: Callable[[int], str], now: float, weights: RankingWeights, size: int) -> list[ScoredPost]:
+    """size лучших постов из сообщений Telethon по вовлечённости и давности."""
+    scored = (
+        ScoredPost(
+            score=base_score(m, now, weights),
+            message_id=m.id,
+            date=int(m.date.timestamp()) if m.date else 0,
+            text=m.message,
+            link=link(m.id),
+        )
+        for m in messages
+        if m.message
+    )
+    return top_k(scored, size, key=lambda p: p.score)
@@ -0,0 +1,100 @@
+# services/similarity.py
+import hashlib
+import re
+import unicodedata
+from typing import Hashable
+
+from services.keywords import fold, stem
+
+FINGERPRINT_BITS = 64
+# до скольких различающихся бит посты считаются одной новостью
+MAX_DISTANCE = 7
+# 8 полос по 8 бит: при расстоянии <= 7 хотя бы одна полоса совпадает целиком
+_BANDS = 8
+_BAND_BITS = FINGERPRINT_BITS // _BANDS
+_BAND_MASK = (1 << _BAND_BITS) - 1
+
+_URL_RE = re.compile(r"(?:https?://|www\.|t\.me/)\S+", re.IGNORECASE)
+_MENTION_RE = re.compile(r"@\w+")
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+# строки-подписи каналов: «Подписаться», «Наш канал», ссылки на себя и т.п.
+_SIGNATURE_RE = re.compile(
+    r"^\W*(подпис\w*|наш (канал|чат)|источник|читайте (нас|также)|subscribe)\b",
+    re.IGNORECASE,
+)
+
+# служебные слова и призывы вида «Подробнее» не должны сдвигать отпечаток
+_STOP_WORDS = frozenset(
+    "и в во на с со по до из за от о об к ко у а но же ли не что это как так "
+    "был была было были будет также уже еще "
+    "подробнее читать далее полностью источник подписаться реклама "
+    "the a an of to in on and or is are for".split()
+)
+
+
+def _strip_emoji(text: str) -> str:
+    return "".join(ch for ch in text if unicodedata.category(ch) not in ("So", "Sk", "Cs", "Co"))
+
+
+def normalize_post(text: str) -> str:
+    """Текст поста без ссылок, упоминаний, эмодзи и строк-подписей."""
+    lines = [line for line in text.splitlines() if not _SIGNATURE_RE.match(line.strip())]
+    cleaned = _MENTION_RE.sub(" ", _URL_RE.sub(" ", "\n".join(lines)))
+    return " ".join(_WORD_RE.findall(fold(_strip_emoji(cleaned))))
+
+
+def _hash64(token: str) -> int:
+    return int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def simhash(text: str, shingle: int = 1) -> int:
+    """64-битный SimHash по шинглам из основ слов нормализованного текста.
+
+    Для коротких постов отдельные слова устойчивее к правкам, чем n-граммы.
+    """
+    words = [stem(w) for w in normalize_post(text).split() if w not in _STOP_WORDS]
+    if not words:
+        return 0
+    if len(words) < shingle:
+        shingles = [" ".join(words)]
+    else:
+        shingles = [" ".join(words[i:i + shingle]) for i in range(len(words) - shingle + 1)]
+    weights = [0] * FINGERPRINT_BITS
+    for sh in shingles:
+        h = _hash64(sh)
+        for bit in range(FINGERPRINT_BITS):
+            weights[bit] += 1 if h >> bit & 1 else -1
+    return sum(1 << bit for bit, w in enumerate(weights) if w > 0)
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def _bands(fp: int) -> list[tuple[int, int]]:
+    return [(i, fp >> (i * _BAND_BITS) & _BAND_MASK) for i in range(_BANDS)]
+
+
+class FingerprintIndex:
+    """Поиск близких отпечатков по полосам (LSH) без полного перебора."""
+
+    def __init__(self, max_distance: int = MAX_DISTANCE):
+        self.max_distance = max_distance
+        self._buckets: dict[tuple[int, int], list[tuple[int, Hashable]]] = {}
+
+    def add(self, fp: int, value: Hashable):
+        for band in _bands(fp):
+            self._buckets.setdefault(band, []).append((fp, value))
+
+    def find(self, fp: int) -> Hashable | None:
+        """Значение ближайшего отпечатка в пределах max_distance или None."""
+        best, best_dist = None, self.max_distance + 1
+        for band in _bands(fp):
+            for other, value in self._buckets.get(band, ()):
+                dist = hamming(fp, other)
+                if dist < best_dist:
+                    best, best_dist = value, dist
+        return best
+
+    def __contains__(self, fp: int) -> bool:
+        return self.find(fp) is not None
@@ -1,77 +1,283 @@
 # services/summarize.py
 import asyncio
+import re
+from typing import AsyncIterator
+
 import httpx
-from core.settings.settings import settings
 
-from core.utils.utils import logger
+from core.utils.metrics import metrics
+from core.utils.utils import chunk_text, estimate_tokens, logger
+from services.completion import BATCH, INTERACTIVE, STREAMING, CompletionStrategy
+from services.llm_client import YandexGPTClient, get_llm_client
+from services.summary_cache import cache_key, summary_cache
 
-# Берём ключи и каталог через универсальные настройки
-API_KEY = settings.yandex_gpt.api_key
-CATALOG_ID = settings.yandex_gpt.catalog_id
-BASE_URL = "https://llm.api.cloud.yandex.net/foundationModels/v1"
+MODEL = "yandexgpt-lite"
+# менять при любой правке SYSTEM_PROMPT или параметров генерации — это сбрасывает кэш
+PROMPT_VERSION = "v1"
 
 SYSTEM_PROMPT = (
     "Ты выполняешь задачу аннотирования поступающих текстов. "
     "Резюмируй в 1-2 коротких предложения, затем отдельной строкой 5-7 ключевых слов."
 )
 
+BATCH_SYSTEM_PROMPT = (
+    "Ты выполняешь задачу аннотирования поступающих текстов. "
+    "На вход приходят несколько постов, каждый начинается с маркера [[N]]. "
+    "Для каждого поста по порядку выведи маркер [[N]] с тем же номером, "
+    "затем резюме в 1-2 коротких предложения и отдельной строкой 5-7 ключевых слов. "
+    "Не пропускай посты и не объединяй их, ничего не пиши вне блоков."
+)
 
-async def _poll_operation(client: httpx.AsyncClient, operation_id: str, timeout: int = 20):
-    """Ожидание завершения асинхронной операции YandexGPT."""
-    op_url = f"https://operation.api.cloud.yandex.net/operations/{operation_id}"
-    for _ in range(timeout):
-        r = await client.get(op_url, headers={"Authorization": f"Api-Key {API_KEY}"})
-        r.raise_for_status()
-        data = r.json()
-        if data.get("done"):
-            return data
-        await asyncio.sleep(1)
-    raise TimeoutError("Timeout waiting for Yandex operation")
+# Ограничения на один пакетный запрос
+BATCH_INPUT_TOKENS = 6000
+BATCH_MAX_POSTS = 20
+BATCH_TOKENS_PER_SUMMARY = 150
 
+# Длинные тексты: map-reduce по кускам
+LONG_TEXT_TOKENS = 3000
+CHUNK_TOKENS = 2000
+MAP_CONCURRENCY = 4
 
-async def summarize_text_async(text: str) -> str:
-    """Асинхронное резюмирование текста через YandexGPT."""
-    prompt = {
-        "modelUri": f"gpt://{CATALOG_ID}/yandexgpt-lite",
+MAP_SYSTEM_PROMPT = (
+    "Перед тобой фрагмент длинного текста. "
+    "Кратко перескажи его главные факты и мысли в 2-4 предложениях, без вступлений."
+)
+
+REDUCE_SYSTEM_PROMPT = (
+    "Перед тобой пересказы последовательных фрагментов одного текста. "
+    "Составь по ним резюме всего текста в 1-2 коротких предложения, "
+    "затем отдельной строкой 5-7 ключевых слов."
+)
+
+_MARKER_RE = re.compile(r"^\s*\[\[(\d+)\]\]\s*", re.MULTILINE)
+
+
+def _prompt(client: YandexGPTClient, system_prompt: str, text: str, max_tokens: int = 1000) -> dict:
+    return {
+        "modelUri": client.model_uri(MODEL),
         "completionOptions": {
             "stream": False,
             "temperature": 0.2,
-            "maxTokens": 1000
+            "maxTokens": max_tokens
         },
         "messages": [
-            {"role": "system", "text": SYSTEM_PROMPT},
+            {"role": "system", "text": system_prompt},
             {"role": "user", "text": text},
         ],
     }
 
-    headers = {"Content-Type": "application/json", "Authorization": f"Api-Key {API_KEY}"}
 
-    timeout = httpx.Timeout(30.0)  # 30 секунд на весь запрос
-    async with httpx.AsyncClient(timeout=timeout) as client:
+async def _complete(system_prompt: str, text: str, strategy: CompletionStrategy, max_tokens: int = 1000) -> str:
+    client = get_llm_client()
+    return await strategy.complete(client, _prompt(client, system_prompt, text, max_tokens))
+
+
+async def _summarize_long(text: str, strategy: CompletionStrategy) -> str:
+    """Map-reduce: куски по абзацам резюмируются параллельно, затем сводятся."""
+    chunks = chunk_text(text, CHUNK_TOKENS)
+    semaphore = asyncio.Semaphore(MAP_CONCURRENCY)
+
+    async def summarize_chunk(chunk: str) -> str:
+        async with semaphore:
+            return await _complete(MAP_SYSTEM_PROMPT, chunk, strategy, max_tokens=300)
+
+    partials = await asyncio.gather(*(summarize_chunk(c) for c in chunks))
+    combined = "\n\n".join(p for p in partials if p)
+    if estimate_tokens(combined) > LONG_TEXT_TOKENS and len(chunks) > 1:
+        # пересказов слишком много для одного запроса — ещё один уровень свёртки
+        return await _summarize_long(combined, strategy)
+    return await _complete(REDUCE_SYSTEM_PROMPT, combined, strategy)
+
+
+async def _summarize_uncached(text: str, strategy: CompletionStrategy) -> str:
+    """Резюме без кэша. Ошибки пробрасываются наружу.
+
+    Короткий текст — один вызов YandexGPT, длинный — через map-reduce.
+    """
+    if estimate_tokens(text) > LONG_TEXT_TOKENS:
+        return await _summarize_long(text, strategy)
+    return await _complete(SYSTEM_PROMPT, text, strategy)
+
+
+def pack_batches(texts: list[str], token_budget: int = BATCH_INPUT_TOKENS, max_posts: int = BATCH_MAX_POSTS) -> list[list[int]]:
+    """Жадно раскладывает индексы текстов по пакетам в пределах бюджета токенов.
+
+    Текст, который один не влезает в бюджет, уходит отдельным пакетом.
+    """
+    batches, current, used = [], [], 0
+    for i, text in enumerate(texts):
+        cost = estimate_tokens(text)
+        if current and (used + cost > token_budget or len(current) >= max_posts):
+            batches.append(current)
+            current, used = [], 0
+        current.append(i)
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+
+def parse_batch_output(output: str, count: int) -> list[str] | None:
+    """Разбирает ответ модели на блоки [[N]]. None — если формат нарушен."""
+    matches = list(_MARKER_RE.finditer(output))
+    blocks: dict[int, str] = {}
+    for m, nxt in zip(matches, matches[1:] + [None]):
+        idx = int(m.group(1))
+        end = nxt.start() if nxt else len(output)
+        body = output[m.end():end].strip()
+        if not 1 <= idx <= count or idx in blocks or not body:
+            return None
+        blocks[idx] = body
+    if len(blocks) != count:
+        return None
+    return [blocks[i] for i in range(1, count + 1)]
+
+
+async def _summarize_one_by_one(texts: list[str], strategy: CompletionStrategy) -> list[str | BaseException]:
+    """Резюме постов отдельными запросами: ошибка одного поста — на его месте."""
+    return list(await asyncio.gather(*(_summarize_uncached(t, strategy) for t in texts), return_exceptions=True))
+
+
+async def _summarize_batch_uncached(texts: list[str], strategy: CompletionStrategy) -> list[str | BaseException]:
+    """Один запрос на пакет постов; при неразборчивом ответе — по одному.
+
+    Исключение — только если не удался сам пакетный запрос; ошибки
+    отдельных постов возвращаются на их местах.
+    """
+    if len(texts) == 1:
+        return await _summarize_one_by_one(texts, strategy)
+
+    client = get_llm_client()
+    body = "\n\n".join(f"[[{i}]]\n{t.strip()}" for i, t in enumerate(texts, 1))
+    prompt = {
+        "modelUri": client.model_uri(MODEL),
+        "completionOptions": {
+            "stream": False,
+            "temperature": 0.2,
+            "maxTokens": min(8000, BATCH_TOKENS_PER_SUMMARY * len(texts)),
+        },
+        "messages": [
+            {"role": "system", "text": BATCH_SYSTEM_PROMPT},
+            {"role": "user", "text": body},
+        ],
+    }
+    output = await strategy.complete(client, prompt)
+    parsed = parse_batch_output(output, len(texts))
+    if parsed is not None:
+        return parsed
+
+    logger.warning("Не удалось разобрать пакетный ответ YandexGPT (%d постов), резюмируем по одному", len(texts))
+    return await _summarize_one_by_one(texts, strategy)
+
+
+async def summarize_text_or_raise(text: str, strategy: CompletionStrategy = INTERACTIVE) -> str:
+    """Резюме через кэш; ошибки YandexGPT пробрасываются.
+
+    Для тех, кто умеет повторить попытку (воркер очереди, дайджест):
+    текст ошибки вместо резюме им не нужен.
+    """
+    key = cache_key(text, f"{PROMPT_VERSION}:{MODEL}")
+    return await summary_cache.get_or_compute(key, lambda: _summarize_uncached(text, strategy))
+
+
+@metrics.timed("llm.summarize_text")
+async def summarize_text_async(
+    text: str,
+    use_cache: bool = True,
+    strategy: CompletionStrategy = INTERACTIVE,
+) -> str:
+    """Асинхронное резюмирование текста через YandexGPT.
+
+    strategy задаёт способ дождаться ответа: INTERACTIVE для команд
+    пользователя, BATCH для дайджеста (см. services/completion.py).
+    """
+    try:
+        if not use_cache:
+            return await _summarize_uncached(text, strategy)
+        return await summarize_text_or_raise(text, strategy)
+
+    except httpx.TimeoutException:
+        logger.error("Timeout при обращении к YandexGPT")
+        return "⚠️ Ошибка: сервис не ответил вовремя."
+    except httpx.HTTPStatusError as e:
+        logger.error(f"Ошибка API: {e.response.status_code} {e.response.text}")
+        return "⚠️ Ошибка при обращении к API YandexGPT."
+    except Exception as e:
+        logger.exception(f"Непредвиденная ошибка: {e}")
+        return "⚠️ Ошибка обработки текста."
+
+
+async def summarize_text_stream(text: str) -> AsyncIterator[str]:
+    """Резюме по мере генерации: каждый элемент — весь текст на текущий момент.
+
+    Ответ из кэша и резюме длинного текста (map-reduce) приходят одним
+    элементом. Если поток оборвался, последним элементом придёт результат
+    summarize_text_async — полное резюме или сообщение об ошибке.
+    """
+    key = cache_key(text, f"{PROMPT_VERSION}:{MODEL}")
+    cached = await summary_cache.lookup(key)
+    if cached is not None:
+        yield cached
+        return
+    if estimate_tokens(text) > LONG_TEXT_TOKENS:
+        yield await summarize_text_async(text)
+        return
+
+    client = get_llm_client()
+    summary = ""
+    try:
+        async for summary in STREAMING.stream(client, _prompt(client, SYSTEM_PROMPT, text)):
+            yield summary
+    except Exception as e:
+        logger.warning("Стриминг YandexGPT прервался (%s), дожидаемся полного ответа", e)
+        yield await summarize_text_async(text)
+        return
+    if not summary:
+        yield await summarize_text_async(text)
+        return
+    await summary_cache.store(key, summary)
+
+
+@metrics.timed("llm.summarize_batch")
+async def summarize_batch_async(
+    texts: list[str],
+    strategy: CompletionStrategy = BATCH,
+    token_budget: int = BATCH_INPUT_TOKENS,
+) -> list[str | None]:
+    """Пакетное резюмирование: несколько постов в одном запросе к YandexGPT.
+
+    Возвращает резюме в порядке texts. Уже известные резюме берутся из кэша,
+    остальные упаковываются в запросы не больше token_budget токенов.
+    Если пакет не удался, посты резюмируются по одному; None — резюме
+    не получилось и после этого, текст ошибки вместо него не подставляется.
+    """
+    summaries: list[str | None] = [None] * len(texts)
+    keys = [cache_key(t, f"{PROMPT_VERSION}:{MODEL}") for t in texts]
+    pending: dict[str, list[int]] = {}
+    for i, key in enumerate(keys):
+        cached = await summary_cache.lookup(key)
+        if cached is not None:
+            summaries[i] = cached
+        else:
+            # одинаковые тексты в пакете резюмируем один раз
+            pending.setdefault(key, []).append(i)
+
+    unique = [texts[idxs[0]] for idxs in pending.values()]
+    unique_keys = list(pending)
+
+    async def run_batch(batch: list[int]):
         try:
-            # Запрос на создание асинхронной операции
-            r = await client.post(f"{BASE_URL}/completionAsync", headers=headers, json=prompt)
-            r.raise_for_status()
-            op_id = r.json().get("id")
-            if not op_id:
-                raise RuntimeError("Не удалось получить operation id от YandexGPT")
-
-            # Ожидаем завершения операции
-            res = await _poll_operation(client, op_id)
-            summary = (
-                res.get("response", {})
-                .get("alternatives", [{}])[0]
-                .get("message", {})
-                .get("text", "")
-            )
-            return summary.strip()
-        
-        except httpx.TimeoutException:
-            logger.error("Timeout при обращении к YandexGPT")
-            return "⚠️ Ошибка: сервис не ответил вовремя."
-        except httpx.HTTPStatusError as e:
-            logger.error(f"Ошибка API: {e.response.status_code} {e.response.text}")
-            return "⚠️ Ошибка при обращении к API YandexGPT."
+            results = await _summarize_batch_uncached([unique[j] for j in batch], strategy)
         except Exception as e:
-            logger.exception(f"Непредвиденная ошибка: {e}")
-            return "⚠️ Ошибка обработки текста."
\ No newline at end of file
+            logger.exception(f"Ошибка пакетного резюмирования: {e}")
+            results = await _summarize_one_by_one([unique[j] for j in batch], strategy)
+        for j, summary in zip(batch, results):
+            if isinstance(summary, BaseException):
+                logger.error(f"Не удалось резюмировать пост: {summary}")
+                continue
+            await summary_cache.store(unique_keys[j], summary)
+            for i in pending[unique_keys[j]]:
+                summaries[i] = summary
+
+    await asyncio.gather(*(run_batch(b) for b in pack_batches(unique, token_budget)))
+    return summaries
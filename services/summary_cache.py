@@ -0,0 +1,121 @@
+# services/summary_cache.py
+import asyncio
+import hashlib
+import re
+import unicodedata
+from dataclasses import dataclass, asdict
+from typing import Awaitable, Callable
+
+from core.utils.cache import LRUCache
+from core.utils.utils import logger
+from services.db import get_cached_summary, put_cached_summary
+
+_WS_RE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """Нормализация для ключа кэша: NFKC и схлопывание пробелов."""
+    return _WS_RE.sub(" ", unicodedata.normalize("NFKC", text)).strip()
+
+
+def cache_key(text: str, version: str) -> str:
+    payload = f"{version}\n{normalize_text(text)}".encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()
+
+
+@dataclass
+class CacheStats:
+    memory_hits: int = 0
+    db_hits: int = 0
+    misses: int = 0
+    coalesced: int = 0
+    db_errors: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.memory_hits + self.db_hits + self.misses
+        return (self.memory_hits + self.db_hits) / total if total else 0.0
+
+    def as_dict(self) -> dict:
+        return {**asdict(self), "hit_rate": round(self.hit_rate, 3)}
+
+
+class SummaryCache:
+    """Двухуровневый кэш резюме: LRU в памяти + таблица summaries_cache в YDB.
+
+    Одновременные запросы с одинаковым ключом объединяются (single-flight):
+    к LLM уходит одна операция, остальные ждут её результат.
+    """
+
+    def __init__(self, maxsize: int = 2048, persistent: bool = True):
+        self.memory = LRUCache(maxsize=maxsize)
+        self.persistent = persistent
+        self.stats = CacheStats()
+        self._inflight: dict[str, asyncio.Future] = {}
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[str]]) -> str:
+        cached = self.memory.get(key)
+        if cached is not None:
+            self.stats.memory_hits += 1
+            return cached
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.stats.coalesced += 1
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await self._load_or_compute(key, compute)
+        except BaseException as e:
+            future.set_exception(e)
+            # исключение уже проброшено вызывающему; не даём asyncio ругаться
+            # на «never retrieved», если ожидающих не было
+            future.exception()
+            raise
+        else:
+            future.set_result(value)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    async def lookup(self, key: str) -> str | None:
+        """Поиск без вычисления: сначала память, затем YDB."""
+        cached = self.memory.get(key)
+        if cached is not None:
+            self.stats.memory_hits += 1
+            return cached
+        if self.persistent:
+            try:
+                stored = await get_cached_summary(key)
+            except Exception as e:
+                self.stats.db_errors += 1
+                logger.warning("Summary cache read failed: %s", e)
+                stored = None
+            if stored is not None:
+                self.stats.db_hits += 1
+                self.memory.set(key, stored)
+                return stored
+        self.stats.misses += 1
+        return None
+
+    async def store(self, key: str, value: str):
+        self.memory.set(key, value)
+        if self.persistent:
+            try:
+                await put_cached_summary(key, value)
+            except Exception as e:
+                self.stats.db_errors += 1
+                logger.warning("Summary cache write failed: %s", e)
+
+    async def _load_or_compute(self, key: str, compute: Callable[[], Awaitable[str]]) -> str:
+        stored = await self.lookup(key)
+        if stored is not None:
+            return stored
+        value = await compute()
+        await self.store(key, value)
+        return value
+
+
+summary_cache = SummaryCache()
@@ -0,0 +1,109 @@
+# services/telethon_fetch.py
+import asyncio
+import time
+from dataclasses import dataclass, asdict
+
+from telethon import TelegramClient
+from telethon.errors import ChannelInvalidError, ChannelPrivateError, FloodWaitError
+from telethon.tl.types import InputPeerChannel
+
+from core.utils.utils import logger
+from services.db import delete_channel_entity, get_channel_entities, save_channel_entity
+from services.digest_planner import ChannelPlan
+
+
+@dataclass
+class FetchStats:
+    resolved_from_cache: int = 0
+    resolved_remote: int = 0
+    flood_waits: int = 0
+    flood_wait_seconds: int = 0
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+class FloodGate:
+    """Пауза для одного вида запросов после FloodWait.
+
+    Ждут только запросы этого вида; остальные продолжают работать.
+    """
+
+    def __init__(self):
+        self._open_at = 0.0
+
+    def close_for(self, seconds: float):
+        self._open_at = max(self._open_at, time.monotonic() + seconds)
+
+    async def wait(self):
+        while (delay := self._open_at - time.monotonic()) > 0:
+            await asyncio.sleep(delay)
+
+
+class ChannelFetcher:
+    """Загрузка постов каналов поверх TelegramClient.
+
+    Разрешённые каналы (id + access_hash) хранятся в YDB, поэтому
+    ResolveUsername вызывается только для новых каналов. FloodWait паркует
+    лишь запросы того же вида (resolve или history): они освобождают слот
+    и ждут, пока остальные запросы выполняются дальше.
+    """
+
+    def __init__(self, client: TelegramClient, concurrency: int = 4, max_flood_retries: int = 3):
+        self.client = client
+        # FloodWait обрабатываем сами, а не спящим внутри вызова клиентом
+        self.client.flood_sleep_threshold = 0
+        self.max_flood_retries = max_flood_retries
+        self._slots = asyncio.Semaphore(concurrency)
+        self._gates = {"resolve": FloodGate(), "history": FloodGate()}
+        self._peers: dict[str, InputPeerChannel] = {}
+        self.stats = FetchStats()
+
+    async def preload(self, plans: list[ChannelPlan]):
+        """Одним запросом подтягивает из YDB известные каналы прогона.
+
+        Каналы, уже разрешённые раньше в этом прогоне, повторно не читаются.
+        """
+        stored = await get_channel_entities(list({p.key for p in plans if p.key not in self._peers}))
+        for key, (channel_id, access_hash) in stored.items():
+            self._peers[key] = InputPeerChannel(channel_id=channel_id, access_hash=access_hash)
+
+    async def _call(self, kind: str, fn, *args, **kwargs):
+        gate = self._gates[kind]
+        for attempt in range(self.max_flood_retries + 1):
+            await gate.wait()
+            async with self._slots:
+                try:
+                    return await fn(*args, **kwargs)
+                except FloodWaitError as e:
+                    if attempt == self.max_flood_retries:
+                        raise
+                    self.stats.flood_waits += 1
+                    self.stats.flood_wait_seconds += e.seconds
+                    logger.warning("FloodWait %ss on %s, parking %s requests", e.seconds, kind, kind)
+                    gate.close_for(e.seconds)
+
+    async def resolve(self, plan: ChannelPlan):
+        peer = self._peers.get(plan.key)
+        if peer is not None:
+            self.stats.resolved_from_cache += 1
+            return peer
+        entity = await self._call("resolve", self.client.get_input_entity, plan.url)
+        self.stats.resolved_remote += 1
+        if isinstance(entity, InputPeerChannel):
+            self._peers[plan.key] = entity
+            await save_channel_entity(plan.key, entity.channel_id, entity.access_hash)
+        return entity
+
+    async def get_messages(self, plan: ChannelPlan, **kwargs):
+        peer = await self.resolve(plan)
+        try:
+            return await self._call("history", self.client.get_messages, peer, **kwargs)
+        except (ChannelInvalidError, ChannelPrivateError, ValueError):
+            if plan.key not in self._peers:
+                raise
+            # сохранённый access_hash устарел — разрешаем канал заново один раз
+            self._peers.pop(plan.key, None)
+            await delete_channel_entity(plan.key)
+            peer = await self.resolve(plan)
+            return await self._call("history", self.client.get_messages, peer, **kwargs)
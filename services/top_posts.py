@@ -0,0 +1,82 @@
+# services/top_posts.py
+# Топ постов канала для /top_posts: ранжирование по вовлечённости, давности
+# и ключевым словам пользователя. Вебхук не подключается к Telegram —
+# кандидатов канала собирает дайджест из уже загруженных постов и хранит в YDB.
+# Так сессия Telethon остаётся одна на весь бот и не дублируется тёплыми
+# контейнерами вебхука (AUTH_KEY_DUPLICATED).
+import re
+import time
+from dataclasses import asdict
+
+from core.settings.settings import settings
+from core.utils.cache import LRUCache
+from core.utils.utils import normalize_channel
+from services.db import load_channel_top_posts, save_channel_top_posts
+from services.digest_planner import ChannelPlan
+from services.keywords import compile_keywords
+from services.ranking import RankingWeights, ScoredPost, rank_messages, top_k
+
+# символы разметки Markdown, ломающие ссылку [текст](url) в ответе
+_MARKDOWN_RE = re.compile(r"[\[\]*_`]")
+PREVIEW_CHARS = 120
+
+# кандидаты каналов переиспользуются всеми пользователями до истечения TTL
+_pools: LRUCache | None = None
+
+
+def _weights() -> RankingWeights:
+    return RankingWeights(half_life_hours=settings.top_posts.half_life_hours)
+
+
+async def store_channel_pool(plan: ChannelPlan, messages: list):
+    """Сохраняет кандидатов канала из сообщений, которые загрузил дайджест."""
+    pool = rank_messages(messages, plan.link, time.time(), _weights(), settings.top_posts.pool_size)
+    await save_channel_top_posts(plan.key, [asdict(p) for p in pool])
+
+
+async def channel_pools(urls: list[str]) -> dict[str, list[ScoredPost]]:
+    """Кандидаты каналов по ключу normalize_channel: кэш с TTL, остальное — одним запросом."""
+    global _pools
+    if _pools is None:
+        _pools = LRUCache(maxsize=2000, ttl=settings.top_posts.cache_ttl)
+    pools, missing = {}, []
+    for key in {normalize_channel(url) for url in urls}:
+        pool = _pools.get(key)
+        if pool is None:
+            missing.append(key)
+        else:
+            pools[key] = pool
+    for key, posts in (await load_channel_top_posts(missing)).items():
+        pool = [ScoredPost(**p) for p in posts]
+        _pools.set(key, pool)
+        pools[key] = pool
+    return pools
+
+
+def _preview(text: str) -> str:
+    line = _MARKDOWN_RE.sub("", text.strip().split("\n", 1)[0])
+    return line if len(line) <= PREVIEW_CHARS else line[:PREVIEW_CHARS - 1] + "…"
+
+
+def rank_pool(pool: list[ScoredPost], keywords: list, k: int | None = None) -> list[dict]:
+    """k лучших постов канала с учётом ключевых слов пользователя.
+
+    Кандидаты канала общие для всех пользователей; ключевые слова лишь
+    поднимают совпавшие посты внутри этого набора.
+    """
+    index = compile_keywords(tuple(keywords))
+    boost = 1 + _weights().keyword_boost
+    ranked = top_k(pool, k or settings.top_posts.top_k, key=lambda p: p.score * boost if index.matches(p.text) else p.score)
+    return [{"text": _preview(p.text), "link": p.link, "score": round(p.score, 2)} for p in ranked]
+
+
+async def get_top_posts(channels: list[dict], k: int | None = None) -> list[list[dict] | None]:
+    """Топ постов для каждого канала пользователя, в порядке channels.
+
+    None — дайджест ещё ни разу не загружал этот канал.
+    """
+    pools = await channel_pools([ch["url"] for ch in channels])
+    return [
+        rank_pool(pools[key], ch["keywords"], k) if (key := normalize_channel(ch["url"])) in pools else None
+        for ch in channels
+    ]
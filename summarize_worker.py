@@ -0,0 +1,120 @@
+# summarize_worker.py
+import asyncio
+import json
+from core.settings.settings import settings
+from core.utils.metrics import metrics
+from core.utils.utils import logger
+from services.completion import INTERACTIVE
+from services.db import save_summary, summary_log
+from services.jobs import JobQueue, ReceivedJob, SummarizeJob, get_job_queue
+from services.summarize import summarize_text_or_raise
+from aiogram import Bot
+
+GIVE_UP_TEXT = "❌ Не удалось подготовить резюме. Попробуй отправить /summarize ещё раз позже."
+
+async def reply(bot: Bot, job: SummarizeJob, text: str):
+    if job.placeholder_message_id:
+        try:
+            # заменяем «Обрабатываю текст...» ответом
+            await bot.edit_message_text(text, chat_id=job.chat_id, message_id=job.placeholder_message_id)
+            return
+        except Exception as e:
+            # «message is not modified» — ответ уже в заглушке (повторная доставка задания)
+            if "not modified" in str(e):
+                return
+            logger.warning("Failed to edit placeholder for job %s: %s", job.job_id, e)
+    await bot.send_message(job.chat_id, text)
+
+async def give_up(bot: Bot, job: SummarizeJob) -> bool:
+    """Сообщает пользователю, что резюме не будет. False — сообщить не удалось."""
+    try:
+        await reply(bot, job, GIVE_UP_TEXT)
+        return True
+    except Exception as e:
+        logger.error("Failed to report summarize job %s failure: %s", job.job_id, e)
+        return False
+
+async def handle_job(bot: Bot, job: SummarizeJob):
+    # ошибка YandexGPT роняет задание: его повторят, а не пришлют текст ошибки
+    summary = await summarize_text_or_raise(job.text, strategy=INTERACTIVE)
+    await save_summary(job.user_id, job.text, summary)
+    await reply(bot, job, summary)
+
+async def process_jobs(bot: Bot, received: list[ReceivedJob]) -> list[ReceivedJob]:
+    """Обрабатывает пачку заданий параллельно, возвращает успешно выполненные."""
+    results = await asyncio.gather(*(handle_job(bot, r.job) for r in received), return_exceptions=True)
+    done = []
+    for r, res in zip(received, results):
+        if isinstance(res, Exception):
+            logger.error("Summarize job %s failed: %s", r.job.job_id, res)
+        else:
+            done.append(r)
+    return done
+
+async def retry_or_give_up(bot: Bot, queue: JobQueue, failed: list[ReceivedJob]) -> list[ReceivedJob]:
+    """Кладёт упавшие задания обратно в очередь со счётчиком попыток.
+
+    Исчерпавшим попытки сообщает об ошибке. Возвращает задания, которые
+    можно подтвердить: переложенные и закрытые; остальные очередь выдаст снова.
+    """
+    settled = []
+    for r in failed:
+        job = r.job
+        job.attempts += 1
+        if job.attempts >= settings.jobs.max_attempts:
+            logger.error("Summarize job %s gave up after %d attempts", job.job_id, job.attempts)
+            if not await give_up(bot, job):
+                continue
+        else:
+            try:
+                await queue.put(job)
+            except Exception as e:
+                logger.error("Failed to retry summarize job %s: %s", job.job_id, e)
+                continue
+        settled.append(r)
+    return settled
+
+def jobs_from_trigger(event) -> list[ReceivedJob]:
+    # формат события триггера Message Queue в Yandex Cloud Functions
+    received = []
+    for m in event.get("messages", []):
+        msg = m["details"]["message"]
+        received.append(ReceivedJob(job=SummarizeJob.from_json(msg["body"]), receipt=msg["message_id"]))
+    return received
+
+async def run_worker(event, context, max_batches: int = 10):
+    """Точка входа воркера: задания из события триггера или дренаж очереди."""
+    bot = Bot(token=settings.bots.bot_token)
+    processed = failed = 0
+    try:
+        if event and event.get("messages"):
+            # сообщения триггера платформа удаляет пачкой после успешного вызова:
+            # ошибка вызова доставила бы заново и уже отвеченные задания,
+            # поэтому непереложенное задание закрываем сообщением об ошибке
+            received = jobs_from_trigger(event)
+            done = await process_jobs(bot, received)
+            failed_jobs = [r for r in received if r not in done]
+            settled = await retry_or_give_up(bot, get_job_queue(), failed_jobs) if failed_jobs else []
+            processed, failed = len(done), len(failed_jobs)
+            for r in failed_jobs:
+                if r not in settled:
+                    await give_up(bot, r.job)
+        else:
+            queue = get_job_queue()
+            for _ in range(max_batches):
+                received = await queue.get_batch(settings.jobs.batch_size)
+                if not received:
+                    break
+                done = await process_jobs(bot, received)
+                failed_jobs = [r for r in received if r not in done]
+                settled = await retry_or_give_up(bot, queue, failed_jobs)
+                # неподтверждённые задания вернутся в очередь после visibility timeout
+                await queue.ack(done + settled)
+                processed += len(done)
+                failed += len(failed_jobs)
+    finally:
+        await summary_log.close()
+        await bot.session.close()
+        metrics.report("summarize_worker")
+    logger.info("Summarize worker: %d done, %d failed", processed, failed)
+    return {"statusCode": 200, "body": json.dumps({"processed": processed, "failed": failed})}
@@ -1,36 +1,132 @@
+# профилировщик подключается первым, чтобы увидеть все последующие импорты
+from core.utils.profiling import startup_profiler
+import asyncio
 import base64
 import json
 from aiogram import Bot, Dispatcher, types
 from aiogram.client.default import DefaultBotProperties
-from core.handlers.handlers import router
-from services.telethon_task import DummyClient
 from core.settings.settings import settings
+from core.utils.metrics import metrics
 from core.utils.utils import logger
 
-# --- Инициализация бота и диспетчера ---
-bot = Bot(
-    token=settings.bots.bot_token)
-dp = Dispatcher()
-dp.include_router(router)
+# --- Ленивая инициализация бота и диспетчера ---
+# Создаются при первом апдейте и переиспользуются в тёплых вызовах.
+bot: Bot | None = None
+dp: Dispatcher | None = None
 
-# --- Telethon-заглушка ---
-client = DummyClient()
+def get_bot() -> Bot:
+    global bot
+    if bot is None:
+        with startup_profiler.phase("bot"):
+            bot = Bot(token=settings.bots.bot_token)
+    return bot
 
-# --- Асинхронная обработка одного апдейта ---async def process_event(event):
-async def process_event(event):
+def get_dispatcher() -> Dispatcher:
+    global dp
+    if dp is None:
+        with startup_profiler.phase("dispatcher"):
+            from core.handlers.handlers import router
+            from core.middlewares.db import DbSessionMiddleware
+
+            dp = Dispatcher()
+            dp.update.middleware(DbSessionMiddleware())
+            dp.include_router(router)
+    return dp
+
+# --- Разбор события ---
+def extract_updates(event) -> list[dict]:
+    """Апдейты из события: одиночный или массив в теле HTTP-запроса,
+    либо сообщения триггера очереди."""
+    if event.get('messages'):
+        return [json.loads(m['details']['message']['body']) for m in event['messages']]
+    body = event['body']
+    if event.get('isBase64Encoded'):
+        body = base64.b64decode(body).decode('utf-8')
+    data = json.loads(body)
+    return data if isinstance(data, list) else [data]
+
+def chat_key(update: dict):
+    # апдейты одного чата должны обрабатываться строго по порядку
+    for kind in ('message', 'edited_message', 'channel_post', 'edited_channel_post'):
+        if kind in update:
+            return update[kind]['chat']['id']
+    if 'callback_query' in update:
+        cq = update['callback_query']
+        msg = cq.get('message')
+        return msg['chat']['id'] if msg else cq['from']['id']
+    for payload in update.values():
+        if isinstance(payload, dict) and 'from' in payload:
+            return payload['from']['id']
+    return ('update', update.get('update_id'))
+
+# --- Асинхронная обработка одного апдейта ---
+async def process_update(raw: dict):
     # Передача полученного сообщения от телеграма в бот
     # Конструкция из официальной документации aiogram для произвольного асинхронного фреймворка
-    update = types.Update.model_validate(json.loads(event['body']), context={"bot": bot})
-    await dp.feed_update(bot, update)
+    bot = get_bot()
+    update = types.Update.model_validate(raw, context={"bot": bot})
+    with metrics.span("webhook.feed_update"):
+        await get_dispatcher().feed_update(bot, update)
+
+# --- Пакетная обработка ---
+async def process_updates(updates: list[dict], concurrency: int | None = None) -> list[dict]:
+    """Разные чаты обрабатываются параллельно (не больше concurrency),
+    апдейты одного чата — последовательно в порядке update_id.
+    Ошибка одного апдейта не влияет на остальные."""
+    concurrency = concurrency or settings.bots.update_concurrency
+    by_chat: dict = {}
+    for raw in sorted(updates, key=lambda u: u.get('update_id', 0)):
+        by_chat.setdefault(chat_key(raw), []).append(raw)
+
+    results: dict[int, dict] = {}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_chat(chat_updates: list[dict]):
+        async with semaphore:
+            for raw in chat_updates:
+                update_id = raw.get('update_id')
+                try:
+                    await process_update(raw)
+                    results[id(raw)] = {'update_id': update_id, 'ok': True}
+                except Exception as e:
+                    logger.exception("Failed to process update %s: %s", update_id, e)
+                    results[id(raw)] = {'update_id': update_id, 'ok': False, 'error': str(e)}
+
+    await asyncio.gather(*(run_chat(chat_updates) for chat_updates in by_chat.values()))
+    return [results[id(raw)] for raw in updates]
+
+async def process_event(event) -> list[dict]:
+    try:
+        return await process_updates(extract_updates(event))
+    finally:
+        # контейнер может быть заморожен сразу после ответа — буфер не держим
+        from services.db import known_users, summary_log
+
+        logger.info("Known users cache: %s", known_users.as_dict())
+        try:
+            await summary_log.close()
+        except Exception as e:
+            logger.exception("Failed to flush summaries log: %s", e)
+        metrics.report("webhook")
 
 # Точка входа
 async def webhook(event, context):
+    # Пачка апдейтов от триггера очереди
+    if event.get('messages'):
+        results = await process_event(event)
+        startup_profiler.report()
+        return {'statusCode': 200, 'body': json.dumps({'results': results})}
+
     # Проверка, что прилетел POST-запрос от Telegram
     if event['httpMethod'] == 'POST':
         # Вызываем коррутин изменения состояния нашего бота
-        await process_event(event)
-        # Возвращаем код 200 успешного выполнения
-        return {'statusCode': 200, 'body': 'ok'}
+        results = await process_event(event)
+        startup_profiler.report()
+        # Возвращаем код 200 успешного выполнения: Telegram не должен
+        # повторять весь пакет из-за одного упавшего апдейта
+        if len(results) == 1:
+            return {'statusCode': 200, 'body': 'ok'}
+        return {'statusCode': 200, 'body': json.dumps({'results': results})}
 
     # Если метод не POST-запрос, то выдаем код ошибки 405
     return {'statusCode': 405}
@@ -40,7 +136,6 @@ if __name__ == "__main__":
     import asyncio
 
     async def local_test():
-        await client.start()
         print("Bot ready for local testing")
 
         test_update = {
@@ -53,8 +148,7 @@ if __name__ == "__main__":
                 "text": "/start"
             }
         }
-        await process_update(test_update)
-        await bot.session.close()
-        await client.disconnect()
+        await process_event({"body": json.dumps(test_update)})
+        await get_bot().session.close()
 
     asyncio.run(local_test())
\ No newline at end of file
@@ -0,0 +1,16 @@
+import os
+
+# настройки читаются лениво: окружение выставляем до первого обращения
+_TEST_ENV = {
+    "API_TOKEN": "123456789:TEST-TOKEN",
+    "YDB_ENDPOINT": "test",
+    "YDB_DATABASE": "test",
+    "YANDEX_CATALOG_ID": "test",
+    "YANDEX_KEY_ID": "test",
+    "YANDEX_API_KEY": "test",
+    "SUMMARIZE_MODE": "sync",
+    "DB_URL": "sqlite+aiosqlite:///:memory:",
+}
+
+for key, value in _TEST_ENV.items():
+    os.environ.setdefault(key, value)
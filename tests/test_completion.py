@@ -0,0 +1,47 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("httpx")
+
+from services import completion
+from services.completion import AdaptivePolling, LatencyTracker, SyncCompletion
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+
+    def json(self):
+        return self.data
+
+
+class FakeClient:
+    async def post(self, method, json):
+        if method == "completion":
+            return FakeResponse({"result": {"alternatives": [{"message": {"text": "sync"}}]}})
+        return FakeResponse({"id": "op1"})
+
+    async def get_operation(self, operation_id):
+        return {"done": True, "response": {"alternatives": [{"message": {"text": "async"}}]}}
+
+
+def test_percentile_defaults_and_window():
+    tracker = LatencyTracker(window=3, default=1.5)
+    assert tracker.percentile(0.5) == 1.5
+    for s in (10, 1, 2, 3):
+        tracker.observe(s)
+    assert tracker.percentile(1.0) == 3
+
+
+def test_only_async_operations_train_first_poll(monkeypatch):
+    tracker = LatencyTracker()
+    monkeypatch.setattr(completion, "operation_latency", tracker)
+    client = FakeClient()
+    polling = AdaptivePolling(min_first=0.0, max_first=0.01)
+
+    assert asyncio.run(SyncCompletion().complete(client, {})) == "sync"
+    assert len(tracker._samples) == 0
+
+    assert asyncio.run(polling.complete(client, {})) == "async"
+    assert len(tracker._samples) == 1
@@ -0,0 +1,47 @@
+import asyncio
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from bench.run import prepare_sqlite
+from services import db
+
+prepare_sqlite()
+
+
+def run_with_db(tmp_path, monkeypatch, scenario):
+    async def main():
+        # локальный SQLite, как в бенчмарке: upsert_into пишет INSERT OR REPLACE
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}")
+        async with engine.begin() as conn:
+            await conn.run_sync(db.Base.metadata.create_all)
+        monkeypatch.setattr(db, "SessionLocal", async_sessionmaker(bind=engine, expire_on_commit=False))
+        try:
+            return await scenario()
+        finally:
+            await engine.dispose()
+
+    return asyncio.run(main())
+
+
+def test_put_cached_summary_overwrites_key(tmp_path, monkeypatch):
+    async def scenario():
+        await db.put_cached_summary("k", "первое")
+        await db.put_cached_summary("k", "второе")
+        return await db.get_cached_summary("k"), await db.get_cached_summary("missing")
+
+    assert run_with_db(tmp_path, monkeypatch, scenario) == ("второе", None)
+
+
+def test_set_channel_watermark_and_deactivate(tmp_path, monkeypatch):
+    async def scenario():
+        async with db.async_get_session() as s:
+            s.add(db.User(user_id=1, username="u", created_at=0))
+            s.add(db.Channel(id=10, user_id=1, url="@a", keywords="", active=True, created_at=0))
+        await db.set_channel_watermark(10, 42, 1000)
+        await db.deactivate_channels(1, [10])
+        async with db.async_get_session() as s:
+            return (await s.execute(select(db.Channel))).scalar_one()
+
+    channel = run_with_db(tmp_path, monkeypatch, scenario)
+    assert (channel.last_message_id, channel.last_message_date, channel.active) == (42, 1000, False)
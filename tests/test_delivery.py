@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("aiogram")
+
+from aiogram.exceptions import TelegramForbiddenError
+from aiogram.methods import SendMessage
+
+from services.delivery import DeliveryScheduler, compose_message_blocks, compose_messages
+
+
+def test_blocks_are_packed_with_header():
+    assert compose_messages(["x" * 5, "y" * 5], header="H", limit=20) == ["H\n\nxxxxx\n\nyyyyy"]
+
+
+def test_block_that_does_not_fit_starts_new_message():
+    assert compose_messages(["a" * 8, "b" * 8, "c" * 8], limit=20) == ["aaaaaaaa\n\nbbbbbbbb", "cccccccc"]
+
+
+def test_header_is_dropped_when_block_alone_does_not_fit():
+    assert compose_messages(["z" * 19], header="HEAD", limit=20) == ["z" * 19]
+
+
+def test_long_line_keeps_order_of_earlier_lines():
+    block = "A" * 10 + "\n" + "B" * 25 + "\n" + "C" * 5
+    assert compose_messages([block], limit=20) == ["A" * 10, "B" * 20, "B" * 5 + "\n" + "C" * 5]
+
+
+def test_every_message_fits_limit():
+    blocks = ["строка\n" * 30, "x" * 95, "короткий"]
+    messages = compose_messages(blocks, header="📰 Дайджест", limit=40)
+    assert all(len(m) <= 40 for m in messages)
+    assert "".join(messages).replace("\n", "").count("x") == 95
+
+
+def test_empty_input_sends_nothing():
+    assert compose_messages([], header="📰 Дайджест") == []
+
+
+def test_messages_know_their_blocks():
+    messages = compose_message_blocks(["a" * 8, "b" * 8, "c" * 30], limit=20)
+    assert [indices for _, indices in messages] == [{0, 1}, {2}, {2}]
+
+
+class BlockedBot:
+    def __init__(self):
+        self.calls = 0
+
+    async def send_message(self, chat_id, text):
+        self.calls += 1
+        raise TelegramForbiddenError(SendMessage(chat_id=chat_id, text=text), "bot was blocked by the user")
+
+
+def test_blocked_chat_is_remembered_and_skipped():
+    bot = BlockedBot()
+    scheduler = DeliveryScheduler(bot, global_rps=1000, chat_rps=1000)
+
+    async def send_twice():
+        return [await scheduler.send(42, "первое"), await scheduler.send(42, "второе")]
+
+    assert asyncio.run(send_twice()) == [False, False]
+    assert scheduler.blocked == {42}
+    assert bot.calls == 1
+    assert scheduler.stats.dropped == 2
@@ -0,0 +1,89 @@
+import asyncio
+import json
+
+import pytest
+
+from services import digest_shards
+from services.digest_planner import DigestItem, Post, plan_digest, plan_stories
+from services.digest_shards import ChannelCheckpoints, DigestShard
+
+
+def test_shard_from_timer_trigger():
+    payload = json.dumps({"shard": 2, "shards": 4, "run_id": 7})
+    event = {"messages": [{"event_metadata": {"event_type": "yandex.cloud.events.serverless.triggers.TimerMessage"},
+                           "details": {"trigger_id": "a1b2", "payload": payload}}]}
+    assert DigestShard.from_event(event) == DigestShard(index=2, count=4, run_id=7)
+
+
+def test_shard_from_http_body_and_top_level():
+    assert DigestShard.from_event({"body": '{"shard": 1, "shards": 3, "run_id": 5}'}) == DigestShard(1, 3, 5)
+    assert DigestShard.from_event({"shard": 0, "shards": 2, "run_id": 9}) == DigestShard(0, 2, 9)
+
+
+def test_shard_out_of_range():
+    with pytest.raises(ValueError):
+        DigestShard.from_event({"shard": 3, "shards": 3})
+
+
+@pytest.fixture
+def saved(monkeypatch):
+    done: set[int] = set()
+
+    async def load(run_id, shard):
+        return set(done)
+
+    async def save(run_id, shard, channel_ids):
+        done.update(channel_ids)
+
+    monkeypatch.setattr(digest_shards, "load_digest_checkpoints", load)
+    monkeypatch.setattr(digest_shards, "save_digest_checkpoints", save)
+    return done
+
+
+def make_plans():
+    return plan_digest([
+        {"id": 1, "user_id": 10, "url": "@a", "keywords": ["рынок"], "last_message_id": 5},
+        {"id": 2, "user_id": 20, "url": "@a", "keywords": ["погода"], "last_message_id": 5},
+        {"id": 3, "user_id": 10, "url": "@b", "keywords": [], "last_message_id": 0},
+    ])
+
+
+def test_checkpoints_complete_after_delivery(saved):
+    async def run():
+        checkpoints = ChannelCheckpoints(DigestShard())
+        await checkpoints.load()
+        plans = [p for p in make_plans() if checkpoints.wants(p)]
+        posts = [Post(id=i, date=i, text=f"рынок растёт {i}") for i in range(6, 9)]
+        items = [DigestItem(plan=plan, posts=posts) for plan in plans]
+        stories, digests = plan_stories(items, 5)
+        await checkpoints.start(items, digests)
+        return checkpoints, digests
+
+    checkpoints, digests = asyncio.run(run())
+    # все подписки получили новые посты: чекпоинты ждут доставки
+    assert saved == set()
+    by_user = {d.user_id: d for d in digests}
+    asyncio.run(checkpoints.delivered(by_user[20]))
+    assert saved == {2}
+    asyncio.run(checkpoints.delivered(by_user[10]))
+    assert saved == {1, 2, 3}
+
+
+def test_checkpoints_skip_completed_and_defer_over_limit(saved):
+    saved.update({1, 2})
+
+    async def run():
+        checkpoints = ChannelCheckpoints(DigestShard(), max_channels=1)
+        await checkpoints.load()
+        return checkpoints, [p.key for p in make_plans() if checkpoints.wants(p)]
+
+    checkpoints, wanted = asyncio.run(run())
+    assert wanted == ["b"]
+    assert checkpoints.skipped == 2
+    assert checkpoints.complete
+
+    saved.clear()
+    checkpoints, wanted = asyncio.run(run())
+    assert len(wanted) == 1
+    assert checkpoints.deferred == 1
+    assert not checkpoints.complete
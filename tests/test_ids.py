@@ -0,0 +1,60 @@
+import threading
+
+from core.utils import ids
+from core.utils.ids import SEQUENCE_BITS, TAIL_BITS, SnowflakeGenerator
+
+
+def test_ids_are_unique_and_increasing():
+    gen = SnowflakeGenerator(worker_id=None)
+    values = [gen.next_id() for _ in range(50000)]
+    assert values == sorted(values)
+    assert len(set(values)) == len(values)
+    assert all(0 < v < 1 << 63 for v in values)
+
+
+def test_worker_id_is_in_tail():
+    gen = SnowflakeGenerator(worker_id=5)
+    value = gen.next_id()
+    assert (value & ((1 << TAIL_BITS) - 1)) >> SEQUENCE_BITS == 5
+
+
+def test_exhausted_millisecond_waits_for_next(monkeypatch):
+    calls = []
+
+    def clock():
+        # часы стоят три вызова, потом переходят в следующие миллисекунды
+        calls.append(1)
+        return 1_800_000_000.0 if len(calls) <= 3 else 1_800_000_000.005
+
+    monkeypatch.setattr(ids.time, "time", clock)
+    gen = SnowflakeGenerator(worker_id=1)
+    gen.next_id()
+    gen._tail |= (1 << SEQUENCE_BITS) - 1
+    last = gen._last_ms
+    assert gen.next_id() >> TAIL_BITS > last
+    assert len(calls) > 3
+
+
+def test_clock_going_back_keeps_ids_increasing(monkeypatch):
+    now = [1_800_000_000.0]
+    monkeypatch.setattr(ids.time, "time", lambda: now[0])
+    gen = SnowflakeGenerator(worker_id=None)
+    first = gen.next_id()
+    now[0] -= 5
+    assert gen.next_id() > first
+
+
+def test_threads_do_not_collide():
+    gen = SnowflakeGenerator(worker_id=None)
+    results: list[list[int]] = [[] for _ in range(4)]
+
+    def work(out):
+        out.extend(gen.next_id() for _ in range(5000))
+
+    threads = [threading.Thread(target=work, args=(out,)) for out in results]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    values = [v for out in results for v in out]
+    assert len(set(values)) == len(values)
@@ -0,0 +1,49 @@
+import random
+
+from services.keywords import KeywordIndex, compile_keywords, normalize
+
+
+def test_normalize_stems_and_folds():
+    assert normalize("Ёлки, Рынки!") == " елк рынк "
+
+
+def test_word_forms_match():
+    index = compile_keywords(("ключевая ставка",))
+    assert index.matches("ЦБ повысил ключевую ставку")
+    assert not index.matches("Погода на выходные")
+
+
+def test_keyword_matches_only_whole_words():
+    index = compile_keywords(("ai",))
+    assert index.matches("Новости AI")
+    assert not index.matches("Mail.ru объявил")
+
+
+def test_each_owner_is_reported_once_per_text():
+    index = KeywordIndex()
+    index.add(1, ["крипта", "биткоин"])
+    index.add(2, ["погода"])
+    index.add(3, [])
+    assert index.match("биткоин и крипта растут") == {1, 3}
+    assert index.match("погода") == {2, 3}
+
+
+def test_overlapping_patterns_use_failure_links():
+    index = KeywordIndex()
+    index.add("long", ["нефть газ уголь"])
+    index.add("short", ["газ"])
+    assert index.match("цены: нефть газ") == {"short"}
+    assert index.match("нефть газ уголь") == {"long", "short"}
+
+
+def test_matches_naive_search():
+    words = ["рынок", "нефть", "газ", "банк", "акции", "курс", "ставка", "ии"]
+    rng = random.Random(7)
+    owners = {n: rng.sample(words, 2) for n in range(20)}
+    index = KeywordIndex()
+    for owner, keywords in owners.items():
+        index.add(owner, keywords)
+    for _ in range(200):
+        text = " ".join(rng.choices(words + ["и", "в", "новости"], k=6))
+        expected = {o for o, kws in owners.items() if any(normalize(k) in normalize(text) for k in kws)}
+        assert index.match(text) == expected
@@ -0,0 +1,34 @@
+import asyncio
+import time
+
+from core.utils.ratelimit import TokenBucket
+
+
+def test_bucket_survives_new_event_loops():
+    bucket = TokenBucket(rate=200, capacity=1)
+
+    async def contend():
+        await asyncio.gather(*(bucket.acquire() for _ in range(3)))
+
+    # синглтоны модулей переживают вызовы функции, и каждый asyncio.run — новый цикл
+    asyncio.run(contend())
+    asyncio.run(contend())
+
+
+def test_bucket_limits_rate():
+    bucket = TokenBucket(rate=100, capacity=1)
+
+    async def take(n):
+        for _ in range(n):
+            await bucket.acquire()
+
+    started = time.monotonic()
+    asyncio.run(take(6))
+    assert time.monotonic() - started >= 0.04
+
+
+def test_pause_borrows_tokens():
+    bucket = TokenBucket(rate=10, capacity=5)
+    assert bucket.try_acquire(5)
+    bucket.pause(1.0)
+    assert not bucket.try_acquire()
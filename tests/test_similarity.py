@@ -0,0 +1,48 @@
+import random
+
+from services.similarity import FingerprintIndex, MAX_DISTANCE, hamming, normalize_post, simhash
+
+POST = (
+    "Центробанк повысил ключевую ставку до 18 процентов годовых. "
+    "Аналитики ожидали сохранения ставки, рубль укрепился к доллару и евро."
+)
+
+
+def test_normalize_post_drops_links_mentions_and_signatures():
+    text = "Рубль укрепился 🚀 https://t.me/news @news\nПодписаться на канал"
+    assert normalize_post(text) == "рубль укрепился"
+
+
+def test_reposts_are_near_duplicates():
+    repost = POST + "\n\nПодробнее: https://example.com/article\n👉 @finance_channel"
+    assert hamming(simhash(POST), simhash(repost)) <= MAX_DISTANCE
+
+
+def test_different_news_are_far_apart():
+    other = "Сборная выиграла финал чемпионата мира по хоккею в овертайме, забив решающую шайбу."
+    assert hamming(simhash(POST), simhash(other)) > MAX_DISTANCE
+
+
+def test_empty_text_has_no_fingerprint():
+    assert simhash("👍 https://t.me/x") == 0
+
+
+def test_index_finds_within_distance():
+    rng = random.Random(3)
+    base = rng.getrandbits(64)
+    index = FingerprintIndex()
+    index.add(base, "base")
+    bits = rng.sample(range(64), MAX_DISTANCE + 1)
+    near = base
+    for bit in bits[:MAX_DISTANCE]:
+        near ^= 1 << bit
+    far = near ^ 1 << bits[-1]
+    assert index.find(near) == "base"
+    assert far not in index
+
+
+def test_index_returns_closest():
+    index = FingerprintIndex()
+    index.add(0b1111, "far")
+    index.add(0b0001, "near")
+    assert index.find(0) == "near"
@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("httpx")
+
+from services import summarize
+from services.summarize import parse_batch_output, summarize_batch_async
+
+
+def test_parse_batch_output_in_order():
+    output = "[[1]]\nпервое\nключи\n\n[[2]] второе\n[[3]]\nтретье"
+    assert parse_batch_output(output, 3) == ["первое\nключи", "второе", "третье"]
+
+
+def test_parse_batch_output_reordered_markers():
+    assert parse_batch_output("[[2]]\nb\n[[1]]\na", 2) == ["a", "b"]
+
+
+@pytest.mark.parametrize("output", [
+    "[[1]]\na",                   # пропущен пост
+    "[[1]]\na\n[[1]]\nb",         # повтор маркера
+    "[[1]]\na\n[[3]]\nc",         # номер вне диапазона
+    "[[1]]\n\n[[2]]\nb",          # пустой блок
+    "просто текст без маркеров",
+])
+def test_parse_batch_output_rejects_broken_format(output):
+    assert parse_batch_output(output, 2) is None
+
+
+class FakeClient:
+    def model_uri(self, model):
+        return model
+
+
+class FakeStrategy:
+    def __init__(self, output):
+        self.output = output
+
+    async def complete(self, client, prompt):
+        return self.output
+
+
+class FakeCache:
+    def __init__(self):
+        self.stored = {}
+
+    async def lookup(self, key):
+        return None
+
+    async def store(self, key, value):
+        self.stored[key] = value
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    calls = []
+
+    async def summarize_one(text, strategy):
+        calls.append(text)
+        if text == "плохой":
+            raise RuntimeError("YandexGPT error")
+        return f"резюме: {text}"
+
+    monkeypatch.setattr(summarize, "get_llm_client", FakeClient)
+    monkeypatch.setattr(summarize, "_summarize_uncached", summarize_one)
+    monkeypatch.setattr(summarize, "summary_cache", FakeCache())
+    return calls
+
+
+def test_unparseable_batch_pays_each_post_once(llm):
+    texts = ["первый", "плохой", "третий"]
+    result = asyncio.run(summarize_batch_async(texts, strategy=FakeStrategy("не по формату")))
+    assert result == ["резюме: первый", None, "резюме: третий"]
+    assert sorted(llm) == sorted(texts)
+    assert sorted(summarize.summary_cache.stored.values()) == ["резюме: первый", "резюме: третий"]
+
+
+def test_parsed_batch_needs_no_fallback(llm):
+    result = asyncio.run(summarize_batch_async(["a", "b"], strategy=FakeStrategy("[[1]] A\n[[2]] B")))
+    assert result == ["A", "B"]
+    assert llm == []